@@ -9,19 +9,20 @@
 
 from __future__ import annotations
 import os
+import glob
+import hashlib
+import functools
+import inspect
 import streamlit as st
 import pandas as pd
+import numpy as np
+import plotly
+import plotly.io as pio
 import data_processor as dp
 import risk_report_generator as rg
 import pivot_risk_visuals as pv
 from typing import Optional, Tuple
-import plotly.express as px
 import math
-import pycountry
-import geopy
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
-import plotly.express as px
 
 from config import (
     APP_NAME,
@@ -46,6 +47,10 @@ import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# Copy-on-Write for the app process: derived frames share buffers until written,
+# so the data_processor / pivot helpers need no defensive .copy()
+pd.set_option("mode.copy_on_write", True)
+
 # -----------------------
 # Page setup & project paths
 # -----------------------
@@ -77,16 +82,23 @@ def load_metrics(uploaded_file: Optional[st.runtime.uploaded_file_manager.Upload
     """
     try:
         if uploaded_file is not None:
-            df = pd.read_csv(uploaded_file)
-            return dp.run_ofac_data_pipeline(None, None, None, df_override=df)
+            df = dp.read_csv(uploaded_file)
+            metrics_df, agg_df, master_df = dp.run_ofac_data_pipeline(None, None, None, df_override=df)
         elif use_defaults and os.path.exists(SDN_PATH):
-            return dp.run_ofac_data_pipeline(
+            metrics_df, agg_df, master_df = dp.run_cached_ofac_data_pipeline(
                 SDN_PATH,
                 ADD_PATH if os.path.exists(ADD_PATH) else None,
                 MAP_PATH if os.path.exists(MAP_PATH) else None,
             )
         else:
             return None, None, None
+        # Country -> ordered Categorical once here (cached) instead of on every rerun
+        if master_df is not None:
+            master_df = dp.normalize_country_categories(master_df)
+            master_df = dp.downcast_dtypes(master_df)
+            if "SDN_Name" in master_df.columns and "Name" not in master_df.columns:
+                master_df["Name"] = master_df["SDN_Name"]
+        return metrics_df, agg_df, master_df
     except Exception as e:
         st.error(f"Error loading metrics: {e}")
         return None, None, None
@@ -94,6 +106,16 @@ def load_metrics(uploaded_file: Optional[st.runtime.uploaded_file_manager.Upload
 # -----------------------
 # Cached helpers for Top-N filtering & heavy computations
 # -----------------------
+def category_isin(col: pd.Series, values: list) -> np.ndarray:
+    """
+    Boolean membership mask for col. Categorical columns are tested on their integer
+    codes (no per-row string hashing); other dtypes fall back to Series.isin.
+    """
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        codes = col.cat.categories.get_indexer(values)
+        return np.isin(col.cat.codes.to_numpy(), codes[codes >= 0])
+    return col.isin(values).to_numpy()
+
 @st.cache_data
 def get_country_totals(metrics_df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -111,14 +133,7 @@ def get_program_totals(master_df: pd.DataFrame) -> pd.DataFrame:
     """
     if master_df is None or master_df.empty or "Sanctions Program" not in master_df.columns:
         return pd.DataFrame(columns=["Sanctions Program", "Total Distinct Entities"])
-    grouped = (
-        master_df.groupby("Sanctions Program")["ent_num"]
-        .nunique()
-        .reset_index(name="Total Distinct Entities")
-        .sort_values("Total Distinct Entities", ascending=False)
-        .reset_index(drop=True)
-    )
-    return grouped
+    return dp.compute_program_totals(master_df)
 
 @st.cache_data
 def prepare_filtered_master(master_df: pd.DataFrame, top_countries: list[str], top_programs: list[str]) -> pd.DataFrame:
@@ -128,57 +143,180 @@ def prepare_filtered_master(master_df: pd.DataFrame, top_countries: list[str], t
     """
     if master_df is None or master_df.empty:
         return pd.DataFrame()
-    df = master_df.copy()
+    # one fused mask, one slice — no defensive copy of the full frame
+    mask = np.ones(len(master_df), dtype=bool)
     if top_countries:
-        df = df[df["Country"].isin(top_countries)]
-    if top_programs and "Sanctions Program" in df.columns:
-        df = df[df["Sanctions Program"].isin(top_programs)]
-    return df
-
-@st.cache_data
+        mask &= category_isin(master_df["Country"], top_countries)
+    if top_programs and "Sanctions Program" in master_df.columns:
+        mask &= category_isin(master_df["Sanctions Program"], top_programs)
+    return master_df.loc[mask]
+
+def _df_digest(df: pd.DataFrame) -> bytes:
+    """Short hash of column labels, index and values; the cache key for DataFrame arguments."""
+    h = hashlib.blake2b(repr(tuple(df.columns)).encode("utf-8"), digest_size=16)
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.digest()
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _df_digest})
 def prepare_pivot_and_heatmap_df(filtered_master: pd.DataFrame) -> pd.DataFrame:
     """
     Prepare pivot DataFrame used by pv.prepare_pivot_data or pv.generate_program_heatmap.
-    This is cached to avoid recompute.
+    This is cached (keyed on a content digest of the input) to avoid recompute.
     """
     if filtered_master is None or filtered_master.empty:
         return pd.DataFrame()
     return pv.prepare_pivot_data(filtered_master)
 
-@st.cache_data
-def generate_heatmap_figure(pivot_df: pd.DataFrame, agg_option: str = "Mean"):
+# Figures are cached as shared resources (no pickling of the nested Plotly dicts on every hit)
+FIGURE_CACHE = dict(hash_funcs={pd.DataFrame: _df_digest}, max_entries=32)
+
+# Prebuilt figure JSON files kept per builder in CACHE_DIR (oldest removed first)
+FIGURE_DISK_CACHE_ENTRIES = 8
+
+@functools.lru_cache(maxsize=None)
+def _builder_version(builder) -> str:
+    """Digest of the plotly version and the builder's module source; code changes invalidate old files."""
+    h = hashlib.blake2b(plotly.__version__.encode("utf-8"), digest_size=8)
+    try:
+        with open(inspect.getsourcefile(builder), "rb") as f:
+            h.update(f.read())
+    except (OSError, TypeError):
+        h.update(builder.__qualname__.encode("utf-8"))
+    return h.hexdigest()
+
+def _prune_figure_cache(builder, keep: str) -> None:
+    """Drop the oldest cached JSON files of builder beyond FIGURE_DISK_CACHE_ENTRIES (never keep)."""
+    paths = sorted(glob.glob(os.path.join(CACHE_DIR, f"{builder.__name__}_*.json")), key=os.path.getmtime)
+    for stale in paths[:max(len(paths) - FIGURE_DISK_CACHE_ENTRIES, 0)]:
+        if stale != keep:
+            os.remove(stale)
+
+def cached_fig(df: pd.DataFrame, builder):
+    """
+    Return builder(df), persisted as Plotly JSON in CACHE_DIR keyed by the builder name, its
+    code/plotly version and a content hash of df, so the same data reuses the prebuilt figure
+    across sessions/restarts.
+    """
+    fig_path = os.path.join(CACHE_DIR, f"{builder.__name__}_{_builder_version(builder)}_{_df_digest(df).hex()}.json")
+    if os.path.exists(fig_path):
+        try:
+            with open(fig_path, "r", encoding="utf-8") as f:
+                return pio.from_json(f.read())
+        except Exception as e:
+            print(f"[cached_fig] Error reading {fig_path}: {e}")
+
+    fig = builder(df)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(fig_path, "w", encoding="utf-8") as f:
+            f.write(fig.to_json())
+        _prune_figure_cache(builder, fig_path)
+    except Exception as e:
+        print(f"[cached_fig] Error writing {fig_path}: {e}")
+    return fig
+
+@st.cache_resource(**FIGURE_CACHE)
+def generate_heatmap_figure(pivot_df: pd.DataFrame, agg_option: str = "Mean", max_cells: int = 50):
     """
     Generate heatmap figure (Plotly) using the pivot_df.
+    Only the top `max_cells` countries and programs (by summed cell value) are plotted.
     """
     if pivot_df is None or pivot_df.empty:
         return None
     # If Sum is requested, convert Avg_Risk_Score to SDN_Count if available
-    tmp = pivot_df.copy()
+    tmp = pivot_df
     if agg_option == "Sum" and ("SDN_Count" in tmp.columns):
-        tmp["Avg_Risk_Score"] = tmp["SDN_Count"]
+        tmp = tmp.assign(Avg_Risk_Score=tmp["SDN_Count"])
+    # subsample to the top-K rows/cols so Plotly does not render every cell
+    top_rows = tmp.groupby("Country", observed=True)["Avg_Risk_Score"].sum().nlargest(max_cells).index
+    top_cols = tmp.groupby("Sanctions Program", observed=True)["Avg_Risk_Score"].sum().nlargest(max_cells).index
+    tmp = tmp[tmp["Country"].isin(top_rows) & tmp["Sanctions Program"].isin(top_cols)]
     # polar: delegate to rg/pv generator
     fig = pv.generate_program_heatmap(tmp)
     return fig
 
-@st.cache_data
+@st.cache_resource(**FIGURE_CACHE)
 def generate_program_bar(pivot_df: pd.DataFrame, selected_country: Optional[str] = None, selected_program: Optional[str] = None):
     if pivot_df is None or pivot_df.empty:
         return None
     return pv.generate_program_bar_chart(pivot_df, selected_country, selected_program)
 
-@st.cache_data
+@st.cache_resource(**FIGURE_CACHE)
 def generate_other_charts(df_vis: pd.DataFrame):
     """
     Generate and return other figures used across the app (donut, stacked, percent stacked, risk heatmap).
     Cached to reduce re-computation on reruns where df_vis unchanged.
+    df_vis is already one row per country, so it is sorted once and shared by all four builders.
     """
+    if df_vis is None or df_vis.empty:
+        return {"donut": None, "stacked": None, "percent_stacked": None, "risk_heatmap": None}
+    country_df = df_vis.sort_values("Total Distinct Entities", ascending=False)
     return {
-        "donut": rg.generate_donut_chart(df_vis) if not df_vis.empty else None,
-        "stacked": rg.generate_stacked_bar(df_vis) if not df_vis.empty else None,
-        "percent_stacked": rg.generate_percent_stacked(df_vis) if not df_vis.empty else None,
-        "risk_heatmap": rg.generate_risk_heatmap(df_vis) if not df_vis.empty else None,
+        "donut": cached_fig(country_df, rg.generate_donut_chart),
+        "stacked": cached_fig(country_df, rg.generate_stacked_bar),
+        "percent_stacked": cached_fig(country_df, rg.generate_percent_stacked),
+        "risk_heatmap": cached_fig(country_df, rg.generate_risk_heatmap),
     }
 
+@st.cache_data(hash_funcs={pd.DataFrame: _df_digest})
+def build_data_dictionary(master_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Column name, dtype, missing/unique counts and a sample value for every column of master_df.
+    One isna() pass feeds both the missing counts and the first non-null sample position.
+    """
+    not_na = master_df.notna().to_numpy()
+    first_valid = not_na.argmax(axis=0)
+    sample_values = [
+        str(master_df.iat[row, j]) if not_na[row, j] else ""
+        for j, row in enumerate(first_valid)
+    ]
+
+    return pd.DataFrame({
+        "Column Name": master_df.columns,
+        "Data Type": master_df.dtypes.astype(str).to_numpy(),
+        "Missing Values": (len(master_df) - not_na.sum(axis=0)).astype(int),
+        "Unique Values": master_df.nunique(dropna=True).astype(int).to_numpy(),
+        "Sample Value": sample_values,
+    })
+
+def _index_by_country_program(df: pd.DataFrame) -> pd.DataFrame:
+    """Sorted (Country, Sanctions Program) MultiIndex over df, columns kept, for cell lookups."""
+    # rows with a missing key can never be selected; dropping them keeps the index fully lexsorted
+    keyed = df.dropna(subset=["Country", "Sanctions Program"])
+    return keyed.set_index(["Country", "Sanctions Program"], drop=False).sort_index()
+
+@st.cache_data(hash_funcs={pd.DataFrame: _df_digest}, max_entries=32)
+def index_by_country_program(df: pd.DataFrame) -> pd.DataFrame:
+    return _index_by_country_program(df)
+
+@st.cache_data
+def get_master_by_country_program(uploaded_file, use_defaults: bool) -> pd.DataFrame:
+    """
+    master_df indexed by (Country, Sanctions Program). Keyed on the same inputs as
+    load_metrics so the 20k+ row frame is not re-hashed on every rerun.
+    """
+    _, _, master_df = load_metrics(uploaded_file, use_defaults)
+    return _index_by_country_program(master_df)
+
+def select_country_program(indexed_df: pd.DataFrame, country, program) -> pd.DataFrame:
+    """Rows of an index_by_country_program frame for one (country, program) cell; empty if absent."""
+    key = (country, program)
+    if key not in indexed_df.index:
+        return indexed_df.iloc[0:0].reset_index(drop=True)
+    return indexed_df.loc[[key]].reset_index(drop=True)
+
+@st.cache_resource(hash_funcs={pd.DataFrame: _df_digest}, max_entries=4)
+def build_dashboard_bundle(df_vis: pd.DataFrame):
+    """
+    Build everything tab1 derives from df_vis exactly once: the data story, the overview
+    figures and the HTML report (utf-8 bytes, shared by the preview and the download button).
+    The report reuses the story and the risk heatmap instead of regenerating them.
+    """
+    story_html = rg.generate_data_story(df_vis)
+    charts = generate_other_charts(df_vis)
+    html_content, _ = rg.generate_ofac_risk_report(df_vis, precomputed=charts, story=story_html)
+    return story_html, charts, html_content.encode("utf-8")
+
     
 # -----------------------
 # TAB 1 — Dashboard
@@ -198,16 +336,14 @@ with tab1:
         st.warning("No metrics available. Upload a valid master CSV or ensure default CSVs exist in the project folder.")
         st.stop()
 
+    # Country / program totals — computed once per rerun and reused for Top-N defaults and lists
+    country_totals_df = get_country_totals(metrics_df)
+    program_totals_df = get_program_totals(master_df)
+
     # Ensure Country Unknown sorting and Name normalization
-    master_df = master_df.copy()
-    # If the pipeline has not replaced '-0-' with 'Unknown', do it here as a safeguard:
-    if "Country" in master_df.columns:
-        master_df["Country"] = master_df["Country"].astype(str).str.strip().replace({"-0-": "Unknown"})
-        # make Unknown appear last in categorical sorting (keeps charts tidy)
-        ordered_cats = sorted([c for c in master_df["Country"].unique() if c != "Unknown"])
-        if "Unknown" in master_df["Country"].unique():
-            ordered_cats.append("Unknown")
-        master_df["Country"] = pd.Categorical(master_df["Country"], categories=ordered_cats, ordered=True)
+    # (load_metrics already converts Country; this only runs if it did not)
+    if "Country" in master_df.columns and not isinstance(master_df["Country"].dtype, pd.CategoricalDtype):
+        master_df = dp.normalize_country_categories(master_df)
 
     if "SDN_Name" in master_df.columns and "Name" not in master_df.columns:
         master_df["Name"] = master_df["SDN_Name"]
@@ -261,26 +397,25 @@ with tab1:
     top_n_options = [5, 10, 20, 30, 50]
     default_country_top = 10 if len(metrics_df) >= 10 else max(3, len(metrics_df))
     top_n_country = st.sidebar.selectbox("Top N Countries (by Total Distinct Entities)", top_n_options, index=top_n_options.index(default_country_top) if default_country_top in top_n_options else 1)
-    program_totals_df = get_program_totals(master_df)
     default_program_top = 10 if len(program_totals_df) >= 10 else max(3, len(program_totals_df))
     top_n_program = st.sidebar.selectbox("Top N Sanctions Programs (by Total Distinct Entities)", top_n_options, index=top_n_options.index(default_program_top) if default_program_top in top_n_options else 1)
 
     # Heatmap aggregation toggle
     agg_option = st.sidebar.radio("Heatmap aggregation", ["Mean", "Sum"], index=0)
+    heatmap_max_cells = st.sidebar.slider("Heatmap max countries × programs", min_value=10, max_value=100, value=50, step=10)
 
     # -----------------------
     # Apply filters to metrics and master
     # -----------------------
     # df_vis is the dataset used for the top-level charts & data story (apply selected countries/programs + top N country limit)
-    df_vis = metrics_df.copy()
+    df_vis = metrics_df
 
+    vis_mask = np.ones(len(df_vis), dtype=bool)
     if selected_countries:
-        df_vis = df_vis[df_vis["Country"].isin(selected_countries)]
+        vis_mask &= category_isin(df_vis["Country"], selected_countries)
     if selected_programs and "Sanctions Program" in df_vis.columns:
-        try:
-            df_vis = df_vis[df_vis["Sanctions Program"].isin(selected_programs)]
-        except Exception:
-            pass
+        vis_mask &= category_isin(df_vis["Sanctions Program"], selected_programs)
+    df_vis = df_vis[vis_mask]
 
     # restrict to top N countries for the main visuals (if column exists)
     if "Total Distinct Entities" in df_vis.columns:
@@ -303,8 +438,8 @@ with tab1:
     # Data Story (above charts) — dynamic with filtered df_vis
     # -----------------------
     st.markdown("### 🧠 Data Story (Auto-generated)")
-    # regenerate story based on df_vis (note: rg.generate_data_story should be reasonably fast)
-    story_html = rg.generate_data_story(df_vis)
+    # story, overview charts and report are built together (cached) from df_vis
+    story_html, other_charts, report_bytes = build_dashboard_bundle(df_vis)
     st.components.v1.html(story_html, height=400, scrolling=True)
 
     st.markdown("---")
@@ -315,24 +450,24 @@ with tab1:
     c1, c2 = st.columns([1, 2])
     with c1:
         st.subheader("Total Distinct Entities")
-        donut_fig = rg.generate_donut_chart(df_vis)
+        donut_fig = other_charts["donut"]
         if donut_fig is not None:
             st.plotly_chart(donut_fig, use_container_width=True)
     with c2:
         st.subheader("SDN Distribution (Stacked)")
-        stacked_fig = rg.generate_stacked_bar(df_vis)
+        stacked_fig = other_charts["stacked"]
         if stacked_fig is not None:
             st.plotly_chart(stacked_fig, use_container_width=True)
 
     c3, c4 = st.columns([1.3, 1.7])
     with c3:
         st.subheader("SDN Distribution (%)")
-        percent_fig = rg.generate_percent_stacked(df_vis)
+        percent_fig = other_charts["percent_stacked"]
         if percent_fig is not None:
             st.plotly_chart(percent_fig, use_container_width=True)
     with c4:
         st.subheader("Country Risk Heatmap")
-        risk_heatmap_fig = rg.generate_risk_heatmap(df_vis)
+        risk_heatmap_fig = other_charts["risk_heatmap"]
         if risk_heatmap_fig is not None:
             st.plotly_chart(risk_heatmap_fig, use_container_width=True)
 
@@ -342,16 +477,14 @@ with tab1:
     # Master data sample
     # -----------------------
     st.subheader("📋 Master Data Sample")
-    safe_sample = master_df.head(20).astype(str)
-    st.dataframe(safe_sample, use_container_width=True)
+    # st.dataframe formats typed columns itself — no need to cast every cell to str
+    st.dataframe(master_df.head(20), use_container_width=True)
 
     # -----------------------
     # Program-level pivot: use Top-N filtered master_df (both top countries & top programs)
     # -----------------------
     # Determine top lists
-    country_totals_df = get_country_totals(metrics_df)
     top_countries = country_totals_df.head(top_n_country)["Country"].tolist() if not country_totals_df.empty else []
-    program_totals_df = get_program_totals(master_df)
     top_programs = program_totals_df.head(top_n_program)["Sanctions Program"].tolist() if not program_totals_df.empty else []
 
     # Allow additional manual multi-select (respect earlier selected_programs / selected_countries)
@@ -384,7 +517,7 @@ with tab1:
     # Heavy heatmap generation — put inside an expander and cache
     with st.expander(f"Generate Program × Country Heatmap (Top {len(chosen_countries)} countries × Top {len(chosen_programs)} programs)"):
         st.write("Heatmap aggregation:", agg_option)
-        heatmap_fig = generate_heatmap_figure(pv_pivot_df, agg_option)
+        heatmap_fig = generate_heatmap_figure(pv_pivot_df, agg_option, heatmap_max_cells)
         if heatmap_fig is not None:
             st.plotly_chart(heatmap_fig, use_container_width=True)
         else:
@@ -396,9 +529,8 @@ with tab1:
     st.markdown("---")
     st.header("📊 OFAC SDN Risk Report")
 
-    # Generate and preview the report
-    report_html, story_text = rg.generate_ofac_risk_report(df_vis)
-    st.components.v1.html(report_html, height=800, scrolling=True)
+    # Preview the report built in the dashboard bundle
+    st.components.v1.html(report_bytes.decode("utf-8"), height=800, scrolling=True)
 
     # Create a temporary directory safely
     #temp_dir = tempfile.mkdtemp()
@@ -408,10 +540,9 @@ with tab1:
     # Export buttons ( HTML)
     # -----------------------
  
-    html_content, _ = rg.generate_ofac_risk_report(df_vis)
     st.download_button(
         label="⬇️ Download HTML report",
-        data=html_content,
+        data=report_bytes,
         file_name="ofac_risk_report.html",
         mime="text/html"
     )
@@ -423,8 +554,8 @@ with tab1:
     st.markdown("---")
     st.header("Interactive Pivot Table — Program & Cross-Border Risk Analysis")
 
-    # Prepare pivot from full master_df
-    pv_pivot_df_full = pv.prepare_pivot_data(master_df)
+    # Prepare pivot from full master_df (cached — unchanged across filter/widget reruns)
+    pv_pivot_df_full = prepare_pivot_and_heatmap_df(master_df)
 
    
     # -----------------------------------
@@ -440,13 +571,13 @@ with tab1:
         key="top_n_selector"
     )
 
-    # Enrich dataframe with risk levels and colors
-    pv_pivot_df_full, pv_pivot_df_styled = pv.add_risk_level_and_colors(pv_pivot_df_full)
+    # Enrich dataframe with risk levels once (the full Styler is never rendered)
+    pv_pivot_df_full, _ = pv.add_risk_level_and_colors(pv_pivot_df_full)
 
     # Sort by Total_SDNs and display top N
-    top_n_df = pv_pivot_df_full.sort_values(by="Total_SDNs", ascending=False).head(top_n)
-    # Re-apply styling only to the filtered data (so colors stay consistent)
-    _, top_n_styled = pv.add_risk_level_and_colors(top_n_df)
+    top_n_df = pv_pivot_df_full.nlargest(top_n, "Total_SDNs")
+    # Style only the Top-N slice, reusing its Risk_Level (so colors stay consistent)
+    top_n_styled = pv.style_risk_levels(top_n_df)
 
     # Display final interactive top N styled table
     st.dataframe(top_n_styled)
@@ -485,17 +616,13 @@ with tab1:
         # -----------------------
         # Show risk insights for selected cell
         # -----------------------
-        cell = pv_pivot_df_full[
-            (pv_pivot_df_full["Country"] == selected_country) &
-            (pv_pivot_df_full["Sanctions Program"] == selected_program)
-        ]
+        cell = select_country_program(index_by_country_program(pv_pivot_df_full), selected_country, selected_program)
 
         if not cell.empty:
             avg_risk_score = cell["Avg_Risk_Score"].values[0]
 
             # Determine risk level from nearest score
-            nearest_score = min(RISK_SCORE_MAP.values(), key=lambda x: abs(x - avg_risk_score))
-            risk_level = [k for k, v in RISK_SCORE_MAP.items() if v == nearest_score][0]
+            risk_level = dp.nearest_risk_level(avg_risk_score)
 
             st.write(f"**Country:** {selected_country}")
             st.write(f"**Sanctions Program:** {selected_program}")
@@ -503,10 +630,10 @@ with tab1:
             st.write(f"**Risk Level:** {risk_level}")
 
             # Filter SDNs from master_df
-            filtered_df_view = master_df[
-                (master_df["Country"] == selected_country) &
-                (master_df["Sanctions Program"] == selected_program)
-            ][["Name", "SDN_Type", "Country", "Sanctions Program","Definition","Active Sanctions Programs"]].drop_duplicates()
+            master_by_pair = get_master_by_country_program(uploaded, use_defaults)
+            filtered_df_view = select_country_program(master_by_pair, selected_country, selected_program)[
+                ["Name", "SDN_Type", "Country", "Sanctions Program","Definition","Active Sanctions Programs"]
+            ].drop_duplicates()
 
             if filtered_df_view.empty:
                 st.warning(f"⚠️ No data found for **Country: {selected_country}** and **Program: {selected_program}**.")
@@ -514,7 +641,7 @@ with tab1:
                 # Add risk level column
                 filtered_df_view["Risk_Level"] = pv.map_risk_score_to_level(avg_risk_score)
 
-                st.dataframe(filtered_df_view.astype(str), use_container_width=True)
+                st.dataframe(filtered_df_view, use_container_width=True)
                 donut_fig = pv.generate_risk_donut_chart(filtered_df_view, selected_country, selected_program)
                 if donut_fig is not None:
                     st.plotly_chart(donut_fig, use_container_width=True)
@@ -570,20 +697,7 @@ with tab3:
         st.warning("No data available to generate the data dictionary.")
         st.stop()
 
-    # safe sample extraction
-    sample_values = []
-    for c in master_df.columns:
-        non_null = master_df[c].dropna()
-        sample = str(non_null.iloc[0]) if not non_null.empty else ""
-        sample_values.append(sample)
-
-    dict_df = pd.DataFrame({
-        "Column Name": master_df.columns,
-        "Data Type": [str(master_df[c].dtype) for c in master_df.columns],
-        "Missing Values": [int(master_df[c].isna().sum()) for c in master_df.columns],
-        "Unique Values": [int(master_df[c].nunique(dropna=True)) for c in master_df.columns],
-        "Sample Value": sample_values,
-    })
+    dict_df = build_data_dictionary(master_df)
 
     descriptions = {
         "ent_num": "Unique identifier linking SDN and Address datasets.",
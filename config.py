@@ -15,24 +15,79 @@
 ##############################################################
 
 import os
+from dataclasses import dataclass
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
+
+# ============================================================
+# 🌱 ENVIRONMENT (read once)
+# ============================================================
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+@dataclass(frozen=True)
+class EnvConfig:
+    """Every os.getenv-derived setting, parsed in one place."""
+    data_dir: str
+    reports_dir: str
+    cache_dir: str
+    assets_dir: str
+    llm_model_path: str
+    embedding_model: str
+    use_rag: bool
+    chunk_size: int
+    chunk_overlap: int
+    is_docker: bool
+    is_streamlit_cloud: bool
+    google_drive_credentials_path: str
+    debug_mode: bool
+    log_level: str
+    max_token_length: int
+    temperature: float
+
+    @classmethod
+    def from_env(cls) -> "EnvConfig":
+        """Read and parse the current environment (call again to pick up changed variables)."""
+        return cls(
+            data_dir=os.getenv("DATA_DIR", os.path.join(PROJECT_DIR, "data")),
+            reports_dir=os.getenv("REPORTS_DIR", os.path.join(PROJECT_DIR, "reports")),
+            cache_dir=os.getenv("CACHE_DIR", os.path.join(PROJECT_DIR, "cache")),
+            assets_dir=os.getenv("ASSETS_DIR", os.path.join(PROJECT_DIR, "assets")),
+            llm_model_path=os.getenv("LLM_MODEL_PATH", "models/ggml-mistral-7b.Q4_K_M.gguf"),
+            embedding_model=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+            use_rag=_env_flag("USE_RAG", "true"),
+            chunk_size=int(os.getenv("CHUNK_SIZE", 1000)),
+            chunk_overlap=int(os.getenv("CHUNK_OVERLAP", 150)),
+            is_docker=_env_flag("IS_DOCKER"),
+            is_streamlit_cloud=_env_flag("IS_STREAMLIT_CLOUD"),
+            google_drive_credentials_path=os.getenv("GOOGLE_DRIVE_CREDENTIALS_PATH", "./credentials.json"),
+            debug_mode=_env_flag("DEBUG_MODE"),
+            log_level=os.getenv("LOG_LEVEL", "INFO"),
+            max_token_length=int(os.getenv("MAX_TOKEN_LENGTH", 2048)),
+            temperature=float(os.getenv("TEMPERATURE", 0.3)),
+        )
+
+# Parsed once at import; module constants below are read from it
+CONFIG = EnvConfig.from_env()
 
 # ============================================================
 # 🗂️ BASE DIRECTORIES & PATHS
 # ============================================================
 
-PROJECT_DIR = os.path.dirname(os.path.abspath(__file__)) if "__file__" in globals() else os.getcwd()
-
 # Resource directories
-DATA_DIR = os.getenv("DATA_DIR", os.path.join(PROJECT_DIR, "data"))
-REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(PROJECT_DIR, "reports"))
-CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(PROJECT_DIR, "cache"))
+DATA_DIR = CONFIG.data_dir
+REPORTS_DIR = CONFIG.reports_dir
+CACHE_DIR = CONFIG.cache_dir
 FONTS_DIR = os.path.join(PROJECT_DIR, "fonts")
-ASSETS_DIR = os.getenv("ASSETS_DIR", os.path.join(PROJECT_DIR, "assets"))
+ASSETS_DIR = CONFIG.assets_dir
 
 # Dataset paths
 SDN_PATH = os.path.join(DATA_DIR, "sdn.csv")
 ADD_PATH = os.path.join(DATA_DIR, "add.csv")
 MAP_PATH = os.path.join(DATA_DIR, "map.csv")
+COUNTRY_COORDS_PATH = os.path.join(DATA_DIR, "country_coords.csv")  # offline Country -> iso3, lat, lon table
 
 # Architecture & font paths
 ARCHITECTURE_PATH = os.path.join(ASSETS_DIR, "architecture.png")
@@ -60,6 +115,27 @@ RISK_SCORE_MAP = {
     "Critical": 6,
 }
 
+# Sorted score / level arrays for np.searchsorted nearest-level lookups
+RISK_SCORES = np.array(sorted(RISK_SCORE_MAP.values()))
+RISK_LEVELS = np.array([k for k, _ in sorted(RISK_SCORE_MAP.items(), key=lambda kv: kv[1])])
+
+# Colorscale / colorbar ticks for heatmaps over risk scores 1..6 (built once, shared by all heatmaps)
+RISK_COLORSCALE = [
+    [0.0, RISK_COLOR_MAP["Low"]],
+    [0.2, RISK_COLOR_MAP["Medium Low"]],
+    [0.4, RISK_COLOR_MAP["Medium"]],
+    [0.6, RISK_COLOR_MAP["Medium High"]],
+    [0.8, RISK_COLOR_MAP["High"]],
+    [1.0, RISK_COLOR_MAP["Critical"]],
+]
+RISK_SCORE_TICKVALS = RISK_SCORES.tolist()
+RISK_TICKTEXT = ["Low", "Med Low", "Medium", "Med High", "High", "Critical"]
+
+# Heatmaps with more cells than this are drawn without cell gaps or annotations;
+# cell annotations are only added up to MAX_ANNOTATED_HEATMAP_CELLS (unreadable and costly beyond)
+LARGE_HEATMAP_MIN_CELLS = 30 * 30
+MAX_ANNOTATED_HEATMAP_CELLS = 400
+
 # ============================================================
 # ⚙️ APP & DEPLOYMENT SETTINGS
 # ============================================================
@@ -76,15 +152,15 @@ STREAMLIT_PAGE_ICON = "🌍"
 # ============================================================
 
 # Default model paths or identifiers
-LLM_MODEL_PATH = os.getenv("LLM_MODEL_PATH", "models/ggml-mistral-7b.Q4_K_M.gguf")
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LLM_MODEL_PATH = CONFIG.llm_model_path
+EMBEDDING_MODEL = CONFIG.embedding_model
 
 # RAG (Retrieval-Augmented Generation) toggle
-USE_RAG = os.getenv("USE_RAG", "true").lower() == "true"
+USE_RAG = CONFIG.use_rag
 
 # Chunking configuration for document embeddings
-CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
-CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 150))
+CHUNK_SIZE = CONFIG.chunk_size
+CHUNK_OVERLAP = CONFIG.chunk_overlap
 
 # AI Agent naming convention
 VALIDATOR_AGENT_NAME = "ValidatorAgent"
@@ -94,26 +170,26 @@ EXECUTIVE_AGENT_NAME = "ExecutiveAgent"
 # ☁️ DEPLOYMENT ENVIRONMENT FLAGS
 # ============================================================
 
-IS_DOCKER = os.getenv("IS_DOCKER", "false").lower() == "true"
-IS_STREAMLIT_CLOUD = os.getenv("IS_STREAMLIT_CLOUD", "false").lower() == "true"
+IS_DOCKER = CONFIG.is_docker
+IS_STREAMLIT_CLOUD = CONFIG.is_streamlit_cloud
 
 # External service endpoints
 OFAC_DATA_URL = "https://www.treasury.gov/ofac/downloads/sdn.csv"
-GOOGLE_DRIVE_CREDENTIALS_PATH = os.getenv("GOOGLE_DRIVE_CREDENTIALS_PATH", "./credentials.json")
+GOOGLE_DRIVE_CREDENTIALS_PATH = CONFIG.google_drive_credentials_path
 
 # ============================================================
 # 🧩 LOGGING & DEBUG SETTINGS
 # ============================================================
 
-DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+DEBUG_MODE = CONFIG.debug_mode
+LOG_LEVEL = CONFIG.log_level
 
 # ============================================================
 # 🧠 AI PROMPT / CONTEXT SETTINGS
 # ============================================================
 
-MAX_TOKEN_LENGTH = int(os.getenv("MAX_TOKEN_LENGTH", 2048))
-TEMPERATURE = float(os.getenv("TEMPERATURE", 0.3))
+MAX_TOKEN_LENGTH = CONFIG.max_token_length
+TEMPERATURE = CONFIG.temperature
 
 
 # ============================================================
@@ -5,10 +5,28 @@
 ###########################
 
 from __future__ import annotations
+import glob
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional, Dict, Any, Tuple
 import pandas as pd
 import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.feather as pafeather
+except ImportError:  # pyarrow is optional — fall back to the pandas tokenizer
+    pa = None
+    pacsv = None
+    pafeather = None
+
+try:
+    import polars as pl
+except ImportError:  # polars is optional — pandas groupby is used instead
+    pl = None
+
 from config import (
     APP_NAME,
     STREAMLIT_LAYOUT,
@@ -21,6 +39,8 @@ from config import (
     MAP_PATH,
     RISK_COLOR_MAP,
     RISK_SCORE_MAP,
+    RISK_SCORES,
+    RISK_LEVELS,
     LLM_MODEL_PATH,
     USE_RAG,
     IS_DOCKER,
@@ -36,32 +56,91 @@ SDN_PROGRAM_COLUMN = "Sanctions Program"
 MAP_JOIN_COLUMN = "Sanction codes"
 MAP_DESCRIPTION_COLUMN = "Active Sanctions Programs"
 
+# Below this many (country, entity) rows the metric reductions run inline — thread start-up would dominate
+PARALLEL_GROUPBY_MIN_ROWS = 200_000
+
+# Parse hints for sdn.csv: text columns skip type inference, low-cardinality ones become categories.
+# ent_num is left to inference so it gets the same dtype as add.csv's join key.
+SDN_DTYPES = {
+    "SDN_Name": "string",
+    SDN_TYPE_COL: "category",
+    SDN_PROGRAM_COLUMN: "category",
+    "remarks on SDN": "string",
+}
+
 # -------------------------
 # Loading helpers
 # -------------------------
-def load_csv(file_path: str) -> Optional[pd.DataFrame]:
-    if file_path is None:
-        return None
-    if not os.path.exists(file_path):
-        print(f"[load_csv] File not found: {file_path}")
-        return None
-    try:
-        df = pd.read_csv(file_path, encoding="latin-1")
-        return df
-    except Exception as e:
-        print(f"[load_csv] Error reading {file_path}: {e}")
-        return None
+def _arrow_dtype(arrow_type):
+    """types_mapper for to_pandas: Arrow-backed dtypes, but dictionary columns stay pandas Categoricals."""
+    return None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
 
-def load_map_data(map_filepath: str) -> Optional[pd.DataFrame]:
-    if map_filepath is None or not os.path.exists(map_filepath):
-        print(f"[load_map_data] Map file not found: {map_filepath}")
-        return None
-    try:
-        map_df = pd.read_csv(map_filepath, encoding="latin-1")
-        return map_df
-    except Exception as e:
-        print(f"[load_map_data] Error loading map file: {e}")
-        return None
+def read_csv(
+    source,
+    encoding: Optional[str] = None,
+    usecols: Optional[list] = None,
+    dtype: Optional[Dict[str, str]] = None
+) -> pd.DataFrame:
+    """
+    Read a CSV path or file-like object into a DataFrame.
+    Uses PyArrow's multi-threaded reader when available (handing the Arrow
+    table to pandas without an extra copy), otherwise plain pd.read_csv.
+    `usecols` limits the parsed columns; `dtype` maps columns to "string" or "category".
+    """
+    dtype = {c: t for c, t in (dtype or {}).items() if usecols is None or c in usecols}
+    if pacsv is None:
+        return pd.read_csv(source, encoding=encoding, usecols=usecols, dtype=dtype or None)
+
+    table = pacsv.read_csv(
+        source,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20, encoding=encoding or "utf8"),
+        parse_options=pacsv.ParseOptions(delimiter=","),
+        convert_options=pacsv.ConvertOptions(
+            strings_can_be_null=True,  # match pandas NaN semantics
+            include_columns=usecols,
+            column_types={c: pa.string() for c in dtype},
+        ),
+    )
+    df = table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=_arrow_dtype)
+    categories = [c for c, t in dtype.items() if t == "category" and c in df.columns]
+    return df.astype({c: "category" for c in categories}) if categories else df
+
+@lru_cache(maxsize=8)
+def _load_csv_cached(file_path: str, mtime_ns: int, size: int, usecols: Optional[tuple], dtype: Optional[tuple]) -> pd.DataFrame:
+    """Parsed CSV, memoized per (path, mtime, size) so an edited file is re-read."""
+    return read_csv(
+        file_path,
+        encoding="latin-1",
+        usecols=list(usecols) if usecols else None,
+        dtype=dict(dtype) if dtype else None,
+    )
+
+def _read_csv_cached(file_path: str, usecols: Optional[list] = None, dtype: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    st = os.stat(file_path)
+    key = (tuple(usecols) if usecols else None, tuple(sorted(dtype.items())) if dtype else None)
+    # Shallow copy: callers may add/replace columns without touching the cached frame
+    return _load_csv_cached(file_path, st.st_mtime_ns, st.st_size, *key).copy(deep=False)
+
+def _require_csv(file_path: Optional[str]) -> str:
+    """Validate an input CSV path up front; raises FileNotFoundError instead of returning None."""
+    if file_path is None or not os.path.exists(file_path):
+        raise FileNotFoundError(f"CSV file not found: {file_path}")
+    return file_path
+
+def _require_columns(df: pd.DataFrame, columns: list) -> None:
+    missing = pd.Index(columns).difference(df.columns)
+    if len(missing):
+        raise ValueError(f"Input dataframe must contain column(s) {missing.tolist()}")
+
+def load_csv(
+    file_path: str,
+    usecols: Optional[list] = None,
+    dtype: Optional[Dict[str, str]] = None
+) -> pd.DataFrame:
+    return _read_csv_cached(_require_csv(file_path), usecols=usecols, dtype=dtype)
+
+def load_map_data(map_filepath: str) -> pd.DataFrame:
+    return _read_csv_cached(_require_csv(map_filepath))
 
 # -------------------------
 # Data cleaning helper
@@ -74,55 +153,161 @@ def clean_invalid_countries(df: pd.DataFrame) -> pd.DataFrame:
     if "Country" not in df.columns:
         return df
 
-    df = df.copy()
     invalid_mask = df["Country"].astype(str).str.strip() == "-0-"
     replaced_count = invalid_mask.sum()
 
     if replaced_count > 0:
-        df.loc[invalid_mask, "Country"] = "Unknown SDN"
+        df = df.assign(Country=df["Country"].mask(invalid_mask, "Unknown SDN"))
         #print(f"[clean_invalid_countries] Replaced {replaced_count} invalid Country values ('-0-') with 'Unknown'.")
 
     return df
 
+def normalize_country_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Strip Country values, map '-0-' to 'Unknown' and store the column as an ordered
+    Categorical with 'Unknown' last (keeps charts tidy). Works in place on the
+    string/dictionary values and is a no-op when Country is already categorical.
+    """
+    if "Country" not in df.columns or isinstance(df["Country"].dtype, pd.CategoricalDtype):
+        return df
+
+    string_dtype = pd.StringDtype("pyarrow") if pacsv is not None else pd.StringDtype()
+    country = df["Country"].astype(string_dtype).str.strip().replace({"-0-": "Unknown"})
+
+    # C-level sort of the distinct values; the inverse indices are the category codes
+    present = country.notna().to_numpy()
+    cats, codes = np.unique(country[present].to_numpy(dtype=str), return_inverse=True)
+    unknown = np.flatnonzero(cats == "Unknown")
+    if unknown.size:
+        u = unknown[0]
+        cats = np.concatenate([np.delete(cats, u), cats[u:u + 1]])
+        codes = np.where(codes == u, len(cats) - 1, codes - (codes > u))
+
+    all_codes = np.full(len(country), -1, dtype=np.int32)
+    all_codes[present] = codes
+    df["Country"] = pd.Categorical.from_codes(all_codes, categories=cats, ordered=True)
+    return df
+
+def downcast_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink the frame for downstream scans: ent_num -> numeric, integral numeric columns
+    -> smallest integer dtype (nullable if they hold NaN), other numerics -> float32,
+    and the low-cardinality text columns SDN_Type / Sanctions Program -> Categorical.
+    Score columns (name contains "Score") stay float64: they are averaged and rounded for display.
+    """
+    if JOIN_COLUMN in df.columns and not pd.api.types.is_numeric_dtype(df[JOIN_COLUMN]):
+        df[JOIN_COLUMN] = pd.to_numeric(df[JOIN_COLUMN], errors="coerce")
+
+    for c in df.select_dtypes(include="number").columns:
+        values = df[c].to_numpy(dtype="float64", na_value=np.nan)
+        present = values[~np.isnan(values)]
+        if np.array_equal(present, np.round(present)):
+            int_dtype = pd.to_numeric(present.astype(np.int64), downcast="integer").dtype
+            if len(present) < len(values):
+                int_dtype = int_dtype.name.capitalize()  # nullable Int8/16/32/64
+            df[c] = pd.Series(values, index=df.index).astype(int_dtype)
+        elif "Score" in c:
+            df[c] = values
+        else:
+            df[c] = values.astype(np.float32)
+
+    for c in [SDN_TYPE_COL, SDN_PROGRAM_COLUMN]:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+    return df
+
 
 # -------------------------
 # Risk logic
 # -------------------------
-def apply_risk_rating(value: float) -> str:
-    if value <= 200:
-        return "Low"
-    elif value <= 400:
-        return "Medium Low"
-    elif value <= 600:
-        return "Medium"
-    elif value <= 800:
-        return "Medium High"
-    elif value <= 1000:
-        return "High"
-    else:
-        return "Critical"
+# Upper (inclusive) entity-count bound of each rating tier; above the last bound is Critical
+_RISK_BINS = np.array([200, 400, 600, 800, 1000])
+_RISK_LABELS = np.array(["Low", "Medium Low", "Medium", "Medium High", "High", "Critical"])
+
+def apply_risk_rating(value):
+    """
+    Rating tier for an entity count. Accepts a scalar (returns str) or a Series/array
+    (returns an ndarray of labels) — one np.searchsorted instead of a per-row .apply.
+    """
+    labels = _RISK_LABELS[np.searchsorted(_RISK_BINS, np.asarray(value, dtype=float), side="left")]
+    return labels.item() if labels.ndim == 0 else labels
+
+def nearest_risk_level(score):
+    """
+    Risk level whose RISK_SCORE_MAP score is nearest to `score` (ties go to the lower level).
+    NaN maps to the lowest level, as the old min()/list scan did.
+    Accepts a scalar or an array; uses np.searchsorted instead of a min()/list scan.
+    """
+    x = np.asarray(score, dtype=float)
+    idx = np.clip(np.searchsorted(RISK_SCORES, x), 1, len(RISK_SCORES) - 1)
+    lower, upper = RISK_SCORES[idx - 1], RISK_SCORES[idx]
+    idx = np.where(np.isnan(x), 0, idx - ((x - lower) <= (upper - x)))
+    levels = RISK_LEVELS[idx]
+    return levels.item() if levels.ndim == 0 else levels
 
 # -------------------------
 # Compute metrics
 # -------------------------
+def individual_mask(sdn_type: pd.Series) -> np.ndarray:
+    """
+    Boolean mask of rows whose SDN_Type is 'individual' (case-insensitive).
+    For a Categorical only the handful of categories are lower-cased; rows are a code lookup.
+    """
+    if isinstance(sdn_type.dtype, pd.CategoricalDtype):
+        is_ind = np.append(sdn_type.cat.categories.str.lower() == "individual", False)  # code -1 (NaN) -> False
+        return is_ind[sdn_type.cat.codes.to_numpy()]
+    return sdn_type.str.lower().eq("individual").fillna(False).to_numpy(dtype=bool)
+
 def compute_country_risk_metrics(master_ofac_df: pd.DataFrame) -> pd.DataFrame:
-    df = master_ofac_df.copy()
-    for c in [JOIN_COLUMN, SDN_TYPE_COL, COUNTRY_COL]:
-        if c not in df.columns:
-            raise ValueError(f"Input dataframe must contain column '{c}'")
+    _require_columns(master_ofac_df, [JOIN_COLUMN, SDN_TYPE_COL, COUNTRY_COL])
+
+    return _metrics_from_entity_pairs(_country_entity_pairs(master_ofac_df))
+
+def _country_entity_pairs(df: pd.DataFrame) -> pd.DataFrame:
+    """Distinct (Country, ent_num, _is_ind) rows — everything the country metrics need."""
+    return (
+        df[[COUNTRY_COL, JOIN_COLUMN]]
+        .assign(_is_ind=individual_mask(df[SDN_TYPE_COL]))
+        .dropna(subset=[JOIN_COLUMN])
+        .drop_duplicates()
+    )
 
-    total = df.groupby(COUNTRY_COL)[JOIN_COLUMN].nunique().rename("Total Distinct Entities")
-    inds = df[df[SDN_TYPE_COL].fillna("").str.lower() == "individual"].groupby(COUNTRY_COL)[JOIN_COLUMN].nunique().rename("Distinct Individuals")
-    non_inds = df[df[SDN_TYPE_COL].fillna("").str.lower() != "individual"].groupby(COUNTRY_COL)[JOIN_COLUMN].nunique().rename("Distinct Non-Individuals")
+def _split_counts(pairs: pd.DataFrame) -> pd.DataFrame:
+    return (
+        pairs.groupby([COUNTRY_COL, "_is_ind"], observed=True, sort=False).size()
+        .unstack(fill_value=0)
+        .reindex(columns=[True, False], fill_value=0)
+        .rename(columns={True: "Distinct Individuals", False: "Distinct Non-Individuals"})
+    )
 
-    metrics = pd.concat([total, inds, non_inds], axis=1).fillna(0).reset_index()
-    metrics["Rating - Personal & Non-Personal"] = metrics["Total Distinct Entities"].apply(apply_risk_rating)
-    metrics["Rating - Personal"] = metrics["Distinct Individuals"].apply(apply_risk_rating)
-    metrics["Rating - Non-Personal"] = metrics["Distinct Non-Individuals"].apply(apply_risk_rating)
+def _total_counts(pairs: pd.DataFrame) -> pd.Series:
+    return pairs.drop_duplicates([COUNTRY_COL, JOIN_COLUMN]).groupby(COUNTRY_COL, observed=True, sort=False).size().rename("Total Distinct Entities")
+
+def _metrics_from_entity_pairs(pairs: pd.DataFrame) -> pd.DataFrame:
+    # Count both splits and the total from the deduped (country, entity, is_individual) rows.
+    # The two reductions are independent and pandas' hash/groupby kernels release the GIL,
+    # so large inputs run them on two threads.
+    if len(pairs) > PARALLEL_GROUPBY_MIN_ROWS:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            split_future = executor.submit(_split_counts, pairs)
+            total_future = executor.submit(_total_counts, pairs)
+            split, total = split_future.result(), total_future.result()
+    else:
+        split, total = _split_counts(pairs), _total_counts(pairs)
 
+    # groupbys above run unsorted; only the per-country result (one row each) is ordered
+    metrics = pd.concat([total, split], axis=1).fillna(0).sort_index().reset_index()
+    metrics["Rating - Personal & Non-Personal"] = apply_risk_rating(metrics["Total Distinct Entities"])
+    metrics["Rating - Personal"] = apply_risk_rating(metrics["Distinct Individuals"])
+    metrics["Rating - Non-Personal"] = apply_risk_rating(metrics["Distinct Non-Individuals"])
+
+    # Ratings -> fixed ordered categories; score and color come straight from the codes
+    levels = list(RISK_SCORE_MAP.keys())
+    color_arr = np.array([RISK_COLOR_MAP[level] for level in levels])
     for col in ["Rating - Personal & Non-Personal", "Rating - Personal", "Rating - Non-Personal"]:
-        metrics[f"{col} Color"] = metrics[col].map(RISK_COLOR_MAP)
-        metrics[f"{col} Score"] = metrics[col].map(RISK_SCORE_MAP)
+        codes = pd.Categorical(metrics[col], categories=levels, ordered=True).codes
+        metrics[f"{col} Color"] = color_arr[codes]
+        metrics[f"{col} Score"] = codes.astype(np.int8) + 1
 
     metrics["Total Distinct Entities"] = metrics["Total Distinct Entities"].astype(int)
     metrics["Distinct Individuals"] = metrics["Distinct Individuals"].astype(int)
@@ -133,11 +318,49 @@ def compute_country_risk_metrics(master_ofac_df: pd.DataFrame) -> pd.DataFrame:
 # -------------------------
 # KPI / KRI computation
 # -------------------------
+def compute_program_totals(master_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Distinct entities per Sanctions Program, largest first (ties by program name).
+    Aggregated in a Polars lazy frame when polars is installed, pandas groupby otherwise;
+    both paths return the same dtypes and row order.
+    """
+    if pl is not None:
+        # multi-threaded hash aggregation; nulls dropped to match pandas groupby/nunique
+        grouped = (
+            pl.from_pandas(master_df[[SDN_PROGRAM_COLUMN, JOIN_COLUMN]], rechunk=False)
+            .lazy()
+            .with_columns(pl.col(SDN_PROGRAM_COLUMN).cast(pl.String))
+            .drop_nulls(SDN_PROGRAM_COLUMN)
+            .group_by(SDN_PROGRAM_COLUMN)
+            .agg(pl.col(JOIN_COLUMN).drop_nulls().n_unique().alias("Total Distinct Entities"))
+            .collect()
+            .to_pandas()
+        )
+        # same dtypes as the pandas path, whichever branch ran
+        grouped = grouped.astype({
+            SDN_PROGRAM_COLUMN: master_df[SDN_PROGRAM_COLUMN].dtype,
+            "Total Distinct Entities": "int64",
+        })
+    else:
+        grouped = (
+            master_df.groupby(SDN_PROGRAM_COLUMN, observed=True)[JOIN_COLUMN]
+            .nunique()
+            .reset_index(name="Total Distinct Entities")
+        )
+    # descending totals, ties broken by program name so the order is deterministic
+    order = np.lexsort((
+        grouped[SDN_PROGRAM_COLUMN].astype(str).to_numpy(),
+        -grouped["Total Distinct Entities"].to_numpy(),
+    ))
+    return grouped.take(order).reset_index(drop=True)
+
 def compute_kpis_kris(metrics_df: pd.DataFrame) -> Tuple[Dict[str, Any], Dict[str, Any], pd.DataFrame]:
-    total_entities = int(metrics_df["Total Distinct Entities"].sum())
-    top_concentration = int(metrics_df["Total Distinct Entities"].max()) if not metrics_df.empty else 0
-    critical_count = int((metrics_df["Rating - Personal & Non-Personal"] == "Critical").sum())
-    non_ind_total = int(metrics_df["Distinct Non-Individuals"].sum())
+    # Plain ndarray reductions — these run on every rerun, so skip pandas' NA/dtype dispatch
+    totals = metrics_df["Total Distinct Entities"].to_numpy(dtype=np.int64)
+    total_entities = int(totals.sum())
+    top_concentration = int(totals.max()) if totals.size else 0
+    critical_count = int(np.count_nonzero(metrics_df["Rating - Personal & Non-Personal"].to_numpy() == "Critical"))
+    non_ind_total = int(metrics_df["Distinct Non-Individuals"].to_numpy(dtype=np.int64).sum())
     non_ind_ratio = f"{round((non_ind_total / total_entities) * 100, 1)}%" if total_entities > 0 else "0%"
 
     kpis = {
@@ -157,9 +380,9 @@ def compute_kpis_kris(metrics_df: pd.DataFrame) -> Tuple[Dict[str, Any], Dict[st
             .reset_index()
         )
     else:
-        grouped = metrics_df.copy()
+        grouped = metrics_df.copy(deep=False)  # CoW: new columns never touch the caller
 
-    grouped["Risk_Level"] = grouped["Total Distinct Entities"].apply(apply_risk_rating)
+    grouped["Risk_Level"] = apply_risk_rating(grouped["Total Distinct Entities"])
     grouped["Risk_Score"] = grouped["Risk_Level"].map(RISK_SCORE_MAP)
     grouped["Risk_Color"] = grouped["Risk_Level"].map(RISK_COLOR_MAP)
     return kpis, kris, grouped
@@ -173,11 +396,9 @@ def prepare_pivot_data(master_ofac_df: pd.DataFrame) -> pd.DataFrame:
     collapsing multiple SDN types into a single aggregated row.
     Returns columns: Country, Sanctions Program, SDN_Count, Avg_Risk_Score, Risk_Color
     """
-    df = master_ofac_df.copy()
+    df = master_ofac_df
     # Ensure required columns exist
-    for c in [JOIN_COLUMN, SDN_PROGRAM_COLUMN, COUNTRY_COL]:
-        if c not in df.columns:
-            raise ValueError(f"Input dataframe must contain column '{c}'")
+    _require_columns(df, [JOIN_COLUMN, SDN_PROGRAM_COLUMN, COUNTRY_COL])
 
     # If Risk_Score not present, compute a simple one from counts
     if "Risk_Score" not in df.columns:
@@ -189,7 +410,7 @@ def prepare_pivot_data(master_ofac_df: pd.DataFrame) -> pd.DataFrame:
             .reset_index(name="tmp_count")
         )
         agg = temp.groupby([COUNTRY_COL, SDN_PROGRAM_COLUMN]).size().reset_index(name="SDN_Count")
-        agg["Risk_Level"] = agg["SDN_Count"].apply(apply_risk_rating)
+        agg["Risk_Level"] = apply_risk_rating(agg["SDN_Count"])
         agg["Risk_Score"] = agg["Risk_Level"].map(RISK_SCORE_MAP)
         agg["Avg_Risk_Score"] = agg["Risk_Score"].astype(float)
         pivot_df = agg
@@ -226,23 +447,20 @@ def run_ofac_data_pipeline(
     df_override: Optional[pd.DataFrame] = None
 ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
-    Returns (metrics_df, aggregated_df, master_df)
+    Returns (metrics_df, aggregated_df, master_df).
+    sdn_file is required (FileNotFoundError if missing); add_file / map_file may be None to skip that merge.
     """
     if df_override is not None:
-        master_df = df_override.copy()
+        master_df = df_override
     else:
-        sdn_df = load_csv(sdn_file)
-        add_df = load_csv(add_file)
-        map_df = load_map_data(map_file)
-
-        if sdn_df is None:
-            print("[pipeline] Missing SDN file — aborting.")
-            return None, None, None
+        sdn_df = load_csv(sdn_file, dtype=SDN_DTYPES)
+        add_df = load_csv(add_file) if add_file is not None else None
+        map_df = load_map_data(map_file) if map_file is not None else None
 
         if add_df is not None and JOIN_COLUMN in sdn_df.columns and JOIN_COLUMN in add_df.columns:
             master_df = pd.merge(sdn_df, add_df, on=JOIN_COLUMN, how="left")
         else:
-            master_df = sdn_df.copy()
+            master_df = sdn_df
 
         if map_df is not None and SDN_PROGRAM_COLUMN in master_df.columns:
             map_df_renamed = map_df.rename(columns={MAP_JOIN_COLUMN: SDN_PROGRAM_COLUMN})
@@ -256,6 +474,52 @@ def run_ofac_data_pipeline(
     _, _, aggregated_df = compute_kpis_kris(metrics_df)
     return metrics_df, aggregated_df, master_df
 
+# -------------------------
+# Cached pipeline (Feather)
+# -------------------------
+def _master_cache_path(files: list, cache_dir: str) -> str:
+    """Cache file name keyed on the modification times of the source CSVs."""
+    stamp = "_".join(str(os.stat(f).st_mtime_ns) if f else "0" for f in files)
+    return os.path.join(cache_dir, f"master_{stamp}.feather")
+
+def run_cached_ofac_data_pipeline(
+    sdn_file: Optional[str],
+    add_file: Optional[str],
+    map_file: Optional[str],
+    cache_dir: str = CACHE_DIR
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Same as run_ofac_data_pipeline, but persists master_df as LZ4 Feather in cache_dir
+    so later cold starts skip CSV parsing and merging. Stale cache files are pruned.
+    Without pyarrow this simply runs the pipeline.
+    """
+    _require_csv(sdn_file)
+    if pafeather is None:
+        return run_ofac_data_pipeline(sdn_file, add_file, map_file)
+
+    cache_path = _master_cache_path([sdn_file, add_file, map_file], cache_dir)
+    if os.path.exists(cache_path):
+        try:
+            master_df = pafeather.read_table(cache_path).to_pandas(
+                split_blocks=True, self_destruct=True, types_mapper=_arrow_dtype
+            )
+            return run_ofac_data_pipeline(None, None, None, df_override=master_df)
+        except Exception as e:
+            print(f"[cache] Error reading {cache_path}: {e}")
+
+    metrics_df, aggregated_df, master_df = run_ofac_data_pipeline(sdn_file, add_file, map_file)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(cache_dir, "master_*.feather")):
+            if stale != cache_path:
+                os.remove(stale)
+        master_df.reset_index(drop=True).to_feather(cache_path, compression="lz4")
+    except Exception as e:
+        print(f"[cache] Error writing {cache_path}: {e}")
+
+    return metrics_df, aggregated_df, master_df
+
 if __name__ == "__main__":
     # quick test
     df = pd.DataFrame({
@@ -1,37 +1,104 @@
+import os
+import copy
+import json
+import functools
+import numpy as np
 import pandas as pd
 import streamlit as st
 from streamlit_folium import st_folium
 import folium
 from folium.plugins import Search
-import geopy
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+from config import COUNTRY_COORDS_PATH, CACHE_DIR
+from data_processor import nearest_risk_level
+
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode.json")
 
 
 # -----------------------
 # Helper: cached geocoding
 # -----------------------
+@functools.lru_cache(maxsize=1)
+def _get_geocoder():
+    """
+    Rate-limited Nominatim geocode callable; geopy is only imported on first use.
+    Errors are raised rather than swallowed, so a failed lookup is never cached as a miss.
+    """
+    from geopy.geocoders import Nominatim
+    from geopy.extra.rate_limiter import RateLimiter
+    return RateLimiter(
+        Nominatim(user_agent="ofac_dashboard").geocode, min_delay_seconds=1, swallow_exceptions=False
+    )
+
+@st.cache_data(show_spinner=False)
+def load_country_coords() -> pd.DataFrame:
+    """Offline Country -> iso3/lat/lon table (data/country_coords.csv)."""
+    if not os.path.exists(COUNTRY_COORDS_PATH):
+        return pd.DataFrame(columns=["Country", "iso3", "lat", "lon"])
+    return pd.read_csv(COUNTRY_COORDS_PATH)
+
+def _load_geocode_cache() -> dict:
+    """Cross-session Nominatim results: {country: {"lat", "lon"}}, or None for names it could not resolve."""
+    try:
+        with open(GEOCODE_CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_geocode_cache(cache: dict) -> None:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(GEOCODE_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+# Placeholder Country values in the OFAC data; never sent to Nominatim
+NON_GEOGRAPHIC_COUNTRIES = {"Unknown", "Unknown SDN", "undetermined"}
+
 @st.cache_data(show_spinner=False)
 def geocode_countries(countries: list[str]) -> pd.DataFrame:
-    geolocator = Nominatim(user_agent="ofac_dashboard")
-    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
-    
-    map_data = []
-    for country in countries:
-        if country != "Unknown":
+    # Resolve from the offline table with one merge; only names it does not know go to Nominatim
+    geo_df = pd.DataFrame({"Country": countries}).merge(
+        load_country_coords()[["Country", "lat", "lon"]], on="Country", how="left"
+    )
+    missing = geo_df.loc[geo_df["lat"].isna(), "Country"].tolist()
+    geo_df = geo_df.dropna(subset=["lat", "lon"])
+    if not missing:
+        return geo_df
+
+    # On-disk cache first; only countries never seen before go over the network
+    cache = _load_geocode_cache()
+    unseen = [c for c in missing if c not in NON_GEOGRAPHIC_COUNTRIES and c not in cache]
+    if unseen:
+        geocode = _get_geocoder()
+        for country in unseen:
             try:
                 location = geocode(country)
-                if location:
-                    map_data.append({
-                        "Country": country,
-                        "lat": location.latitude,
-                        "lon": location.longitude
-                    })
+                cache[country] = {"lat": location.latitude, "lon": location.longitude} if location else None
             except Exception as e:
-                # optionally log error
+                # optionally log error (not cached, so it is retried next session)
                 pass
-    return pd.DataFrame(map_data)
+        _save_geocode_cache(cache)
+
+    map_data = [{"Country": c, **cache[c]} for c in missing if cache.get(c)]
+    return pd.concat([geo_df, pd.DataFrame(map_data)], ignore_index=True)
     
+@st.cache_resource(show_spinner=False)
+def _base_map(tile_url: str, tile_attr: str, basemap_choice: str) -> folium.Map:
+    """Folium map with the selected + extra basemaps and no markers; built once per basemap choice."""
+    m = folium.Map(location=[20, 0], zoom_start=2, tiles="CartoDB positron")
+
+    # Add selected basemap
+    if "google" in tile_url.lower():
+        folium.TileLayer(tiles=tile_url, attr=tile_attr, name=basemap_choice, overlay=False, control=True).add_to(m)
+    else:
+        folium.TileLayer(tile_url, attr=tile_attr, name=basemap_choice, overlay=False, control=True).add_to(m)
+
+    # Add extra basemaps
+    folium.TileLayer("OpenStreetMap", name="OpenStreetMap").add_to(m)
+    folium.TileLayer("CartoDB positron", name="CartoDB Positron").add_to(m)
+    return m
+
 # -----------------------------------------------------------
 # 🌎 Geographical SDN Risk Map (Folium + Google Maps + Search)
 # -----------------------------------------------------------
@@ -59,7 +126,7 @@ def render_geo_sdn_risk_map(pv_pivot_df_full, RISK_SCORE_MAP, RISK_COLOR_MAP):
         tile_url = basemap_options[basemap_choice]
         tile_attr = "Google" if "google" in tile_url.lower() else "OpenStreetMap / CartoDB"
 
-        df = pv_pivot_df_full.copy()
+        df = pv_pivot_df_full  # read-only below
         sdn_col_candidates = [c for c in ['Total_SDNs', 'Entity Count', 'SDN_Count'] if c in df.columns]
         sdn_col = sdn_col_candidates[0] if sdn_col_candidates else None
 
@@ -68,38 +135,43 @@ def render_geo_sdn_risk_map(pv_pivot_df_full, RISK_SCORE_MAP, RISK_COLOR_MAP):
             return
 
         # --- Aggregation
-        country_sdn = df.groupby('Country')[sdn_col].sum().reset_index(name='Total_SDNs')
-        country_risk = df.groupby('Country')['Avg_Risk_Score'].mean().reset_index(name='Avg_Risk_Score')
+        # observed=True: only countries/programs actually present (Country may be categorical)
+        country_agg = (
+            df.groupby('Country', sort=False, observed=True).agg(
+                Total_SDNs=(sdn_col, 'sum'),
+                Avg_Risk_Score=('Avg_Risk_Score', 'mean')
+            ).reset_index()
+        )
 
         prog_agg = (
-            df.groupby(['Country', 'Sanctions Program']).agg(
+            df.groupby(['Country', 'Sanctions Program'], sort=False, observed=True).agg(
                 SDN_Count=(sdn_col, 'sum'),
                 Program_Avg_Risk=('Avg_Risk_Score', 'mean')
             ).reset_index()
         )
 
-        # --- Risk label mapping
-        def program_risk_label(score):
-            try:
-                nearest = min(RISK_SCORE_MAP.values(), key=lambda v: abs(v - score))
-                return [k for k, v in RISK_SCORE_MAP.items() if v == nearest][0]
-            except Exception:
-                return 'Unknown'
+        # --- Risk label mapping (nearest RISK_SCORE_MAP level, one searchsorted per column)
+        def risk_labels(scores):
+            # NaN (empty group) comes back as the lowest level
+            return nearest_risk_level(scores.astype(float))
 
         RISK_EMOJI_MAP = {'Low': '🟢', 'Moderate': '🟡', 'High': '🟠', 'Critical': '🔴', 'Unknown': '⚪'}
 
-        prog_agg['Risk_Label'] = prog_agg['Program_Avg_Risk'].apply(program_risk_label)
+        prog_agg['Risk_Label'] = risk_labels(prog_agg['Program_Avg_Risk'])
         prog_agg['Emoji'] = prog_agg['Risk_Label'].map(lambda x: RISK_EMOJI_MAP.get(x, '⚪'))
 
-        prog_agg = prog_agg.sort_values(['Country', 'SDN_Count'], ascending=[True, False])
-        top3 = prog_agg.groupby('Country').head(3)
-        top3['Prog_Hover'] = top3.apply(
-            lambda r: f"{r['Emoji']} {r['Sanctions Program']} (SDNs: {int(r['SDN_Count'])}) — {r['Risk_Label']}",
-            axis=1
+        # One single-key stable sort; head(3) then keeps each country's top programs in order
+        top3 = (
+            prog_agg.sort_values('SDN_Count', ascending=False, kind='stable')
+            .groupby('Country', sort=False, observed=True).head(3)
         )
-        top3_str = top3.groupby('Country')['Prog_Hover'].apply(lambda arr: '<br>'.join(arr)).reset_index(name='Top3_Programs_Detail')
+        top3 = top3.assign(Prog_Hover=(
+            top3['Emoji'] + " " + top3['Sanctions Program'].astype(str)
+            + " (SDNs: " + top3['SDN_Count'].astype(int).astype(str) + ") — " + top3['Risk_Label']
+        ))
+        top3_str = top3.groupby('Country', sort=False, observed=True)['Prog_Hover'].apply(lambda arr: '<br>'.join(arr)).reset_index(name='Top3_Programs_Detail')
 
-        map_df = country_sdn.merge(country_risk, on='Country', how='left').merge(top3_str, on='Country', how='left')
+        map_df = country_agg.merge(top3_str, on='Country', how='left')
 
         # --- Manual coordinate fixes
         manual_coords = {
@@ -113,70 +185,56 @@ def render_geo_sdn_risk_map(pv_pivot_df_full, RISK_SCORE_MAP, RISK_COLOR_MAP):
         }
 
         # --- Geocode & filter
-        countries_to_geocode = [c for c in map_df['Country'].dropna().unique().tolist() if c != 'Unknown']
+        # Sorted so geocode_countries' cache key does not depend on row order
+        countries_to_geocode = sorted(map_df.loc[map_df['Country'].ne('Unknown'), 'Country'].dropna().unique().tolist())
         geo_df = geocode_countries(countries_to_geocode) if countries_to_geocode else pd.DataFrame()
 
         geo_df = geo_df[~geo_df["Country"].isin(["Northern Gaza", "North Korea"])]
         geo_df = geo_df.drop_duplicates(subset=["Country"], keep="last")
 
-        # Apply manual overrides
-        for country, coords in manual_coords.items():
-            if not geo_df.empty and country in geo_df["Country"].values:
-                geo_df.loc[geo_df["Country"] == country, ["lat", "lon"]] = coords["lat"], coords["lon"]
-            else:
-                geo_df = pd.concat([
-                    geo_df,
-                    pd.DataFrame([{"Country": country, "lat": coords["lat"], "lon": coords["lon"]}])
-                ], ignore_index=True)
+        # Apply manual overrides: overwrite known countries in place, append the rest with one concat
+        manual_df = pd.DataFrame.from_dict(manual_coords, orient="index").rename_axis("Country").reset_index()
+        present = geo_df["Country"].isin(manual_df["Country"])
+        if present.any():
+            geo_df.loc[present, ["lat", "lon"]] = (
+                manual_df.set_index("Country").loc[geo_df.loc[present, "Country"], ["lat", "lon"]].to_numpy()
+            )
+        geo_df = pd.concat([geo_df, manual_df[~manual_df["Country"].isin(geo_df["Country"])]], ignore_index=True)
 
         map_df = map_df.merge(geo_df, on='Country', how='left')
 
         # --- Risk color mapping
-        def score_to_label(x):
-            try:
-                nearest = min(RISK_SCORE_MAP.values(), key=lambda v: abs(v - x))
-                return [k for k, v in RISK_SCORE_MAP.items() if v == nearest][0]
-            except Exception:
-                return 'Unknown'
-
-        map_df['Risk_Level'] = map_df['Avg_Risk_Score'].apply(score_to_label)
+        map_df['Risk_Level'] = risk_labels(map_df['Avg_Risk_Score'])
         map_df['Risk_Color'] = map_df['Risk_Level'].map(lambda x: RISK_COLOR_MAP.get(x, 'gray'))
+        map_df['popup_html'] = (
+            "\n                <b>" + map_df['Country'].astype(str) + "</b><br>\n"
+            "                Total SDNs: " + map_df['Total_SDNs'].astype(int).astype(str) + "<br>\n"
+            "                Country Risk: " + map_df['Risk_Level'].astype(str) + "<br><br>\n"
+            "                <u>Top 3 Programs</u><br>" + map_df['Top3_Programs_Detail'].astype(str) + "\n                "
+        )
 
-        # --- Folium Map
-        m = folium.Map(location=[20, 0], zoom_start=2, tiles="CartoDB positron")
-
-        # Add selected basemap
-        if "google" in tile_url.lower():
-            folium.TileLayer(tiles=tile_url, attr=tile_attr, name=basemap_choice, overlay=False, control=True).add_to(m)
-        else:
-            folium.TileLayer(tile_url, attr=tile_attr, name=basemap_choice, overlay=False, control=True).add_to(m)
-
-        # Add extra basemaps
-        folium.TileLayer("OpenStreetMap", name="OpenStreetMap").add_to(m)
-        folium.TileLayer("CartoDB positron", name="CartoDB Positron").add_to(m)
+        # --- Folium Map: cached base layers, copied so this render's markers never touch the cached map
+        m = copy.deepcopy(_base_map(tile_url, tile_attr, basemap_choice))
 
         # --- Markers layer (for Search)
         marker_layer = folium.FeatureGroup(name="SDN Risk Markers").add_to(m)
 
         color_map = {'Low': 'green', 'Moderate': 'yellow', 'High': 'orange', 'Critical': 'red', 'Unknown': 'gray'}
 
-        for _, row in map_df.iterrows():
-            if pd.notna(row['lat']) and pd.notna(row['lon']):
-                color = color_map.get(row['Risk_Level'], 'gray')
-                popup_html = f"""
-                <b>{row['Country']}</b><br>
-                Total SDNs: {int(row['Total_SDNs'])}<br>
-                Country Risk: {row['Risk_Level']}<br><br>
-                <u>Top 3 Programs</u><br>{row['Top3_Programs_Detail']}
-                """
-                folium.CircleMarker(
-                    location=[row['lat'], row['lon']],
-                    radius=max(4, min(25, row['Total_SDNs'] / 100)),
-                    color=color,
-                    fill=True,
-                    fill_opacity=0.7,
-                    popup=folium.Popup(popup_html, max_width=300)
-                ).add_to(marker_layer)
+        # Per-marker values precomputed as columns; itertuples yields plain tuples (no per-row Series)
+        markers = map_df.dropna(subset=['lat', 'lon']).assign(
+            color=lambda d: d['Risk_Level'].map(color_map).fillna('gray'),
+            radius=lambda d: np.clip(d['Total_SDNs'].to_numpy(dtype=float) / 100, 4, 25),
+        )
+        for lat, lon, color, radius, popup_html in markers[['lat', 'lon', 'color', 'radius', 'popup_html']].itertuples(index=False, name=None):
+            folium.CircleMarker(
+                location=[lat, lon],
+                radius=radius,
+                color=color,
+                fill=True,
+                fill_opacity=0.7,
+                popup=folium.Popup(popup_html, max_width=300)
+            ).add_to(marker_layer)
 
         # --- Add searchable feature
         Search(
@@ -3,6 +3,7 @@
 # Author: Atsu Vovor
 # Date: 2025-11-09
 ###########################
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -19,78 +20,76 @@ from config import (
     MAP_PATH,
     RISK_COLOR_MAP,
     RISK_SCORE_MAP,
+    RISK_COLORSCALE,
+    RISK_SCORE_TICKVALS,
+    RISK_TICKTEXT,
+    LARGE_HEATMAP_MIN_CELLS,
     LLM_MODEL_PATH,
     USE_RAG,
     IS_DOCKER,
     IS_STREAMLIT_CLOUD
 )
 
+# Total_SDNs lower bounds of risk scores 2..6 (<=200 -> 1, ..., >1000 -> 6)
+SDN_COUNT_SCORE_BINS = np.array([201, 401, 601, 801, 1001])
+
+# Avg_Risk_Score bin edges (lower edge inclusive) and the level of each bin
+RISK_LEVEL_EDGES = np.array([1.5, 2.5, 3.5, 4.5, 5.5])
+RISK_LEVEL_LABELS = np.array(["Low", "Medium Low", "Medium", "Medium High", "High", "Critical"])
+RISK_LEVEL_DTYPE = pd.CategoricalDtype([*RISK_LEVEL_LABELS, "Unknown"], ordered=True)
+_LEVEL_CODE_LABELS = np.array(RISK_LEVEL_DTYPE.categories, dtype=object)  # code 6 -> "Unknown"
+
+def map_risk_scores_to_levels(scores) -> np.ndarray:
+    """
+    Vectorized Avg_Risk_Score -> qualitative risk level (NaN -> "Unknown").
+    Level codes come from one np.searchsorted over the bin edges and are mapped
+    to labels in a single take.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    codes = np.searchsorted(RISK_LEVEL_EDGES, scores, side="right").astype(np.int8)
+    codes[np.isnan(scores)] = len(RISK_LEVEL_EDGES) + 1
+    return _LEVEL_CODE_LABELS[codes]
+
 def map_risk_score_to_level(score: float) -> str:
     """
     Convert a numeric Avg_Risk_Score into its qualitative risk level.
     """
-    if pd.isna(score):
-        return "Unknown"
-    if score < 1.5:
-        return "Low"
-    elif score < 2.5:
-        return "Medium Low"
-    elif score < 3.5:
-        return "Medium"
-    elif score < 4.5:
-        return "Medium High"
-    elif score < 5.5:
-        return "High"
-    else:
-        return "Critical"
+    return map_risk_scores_to_levels([score])[0]
+
+def style_risk_levels(df: pd.DataFrame):
+    """
+    Styler coloring Avg_Risk_Score and Risk_Level for a frame that already has Risk_Level
+    (e.g. a Top-N slice of add_risk_level_and_colors output) — no level recomputation.
+    The CSS for each row is built once from Risk_Level and applied column-wise to both columns.
+    """
+    colors = df["Risk_Level"].astype(object).map(RISK_COLOR_MAP)
+    css = np.where(
+        colors.notna(),
+        "background-color: " + colors.fillna("").astype(str) + "; color: white; font-weight: bold;",
+        "",
+    )
+    return (
+        df.style
+        .apply(lambda _: css, subset=["Avg_Risk_Score"], axis=0)
+        .apply(lambda _: css, subset=["Risk_Level"], axis=0)
+    )
 
 def add_risk_level_and_colors(pivot_df: pd.DataFrame) -> pd.DataFrame:
     """
     Add Risk_Level column based on Avg_Risk_Score (numeric) and apply risk color logic
     for both Avg_Risk_Score and Risk_Level columns for Streamlit display.
+    Frames from prepare_pivot_data already carry Risk_Level and are used as-is.
     """
 
     if "Avg_Risk_Score" not in pivot_df.columns:
         return pivot_df, pivot_df.style  # fail-safe
 
-    df = pivot_df.copy()
-
-    # Define mapping thresholds (based on numeric Avg_Risk_Score)
-    def map_score_to_level(score: float) -> str:
-        if score >= 5.5:
-            return "Critical"
-        elif score >= 4.5:
-            return "High"
-        elif score >= 3.5:
-            return "Medium High"
-        elif score >= 2.5:
-            return "Medium"
-        elif score >= 1.5:
-            return "Medium Low"
-        else:
-            return "Low"
-
-    df["Risk_Level"] = df["Avg_Risk_Score"].apply(map_score_to_level)
-
-    # Color formatting function
-    def color_risk(val):
-        if val in RISK_COLOR_MAP:
-            return f"background-color: {RISK_COLOR_MAP[val]}; color: white; font-weight: bold;"
-        try:
-            # If numeric, infer its level then color
-            level = map_score_to_level(val)
-            return f"background-color: {RISK_COLOR_MAP[level]}; color: white; font-weight: bold;"
-        except Exception:
-            return ""
+    df = pivot_df
+    if "Risk_Level" not in df.columns:
+        df = df.assign(Risk_Level=pd.Categorical(map_risk_scores_to_levels(df["Avg_Risk_Score"]), dtype=RISK_LEVEL_DTYPE))
 
     # Apply style to both columns
-    df_styled = (
-        df.style
-        .applymap(color_risk, subset=["Avg_Risk_Score"])
-        .applymap(color_risk, subset=["Risk_Level"])
-    )
-
-    return df, df_styled
+    return df, style_risk_levels(df)
 
 #----
 def prepare_pivot_data(df: pd.DataFrame) -> pd.DataFrame:
@@ -102,72 +101,83 @@ def prepare_pivot_data(df: pd.DataFrame) -> pd.DataFrame:
 
     # If dataset is huge, limit to essential columns to save memory
     cols_to_use = [c for c in ["Country", "Sanctions Program", "ent_num", "Risk_Score"] if c in df.columns]
-    df = df[cols_to_use].copy()
+    df = df[cols_to_use]
+
+    # Group on integer category codes rather than hashing strings (no-op if already categorical)
+    keys = ["Country", "Sanctions Program"]
+    to_category = {c: "category" for c in keys if not isinstance(df[c].dtype, pd.CategoricalDtype)}
+    if to_category:
+        df = df.astype(to_category)
+
+    # Distinct SDNs per pair: one hashed dedupe, then a plain count (no per-group sets as in nunique)
+    total_sdns = (
+        df[keys + ["ent_num"]].dropna(subset=["ent_num"]).drop_duplicates()
+        .groupby(keys, observed=True).size()
+        .astype(np.int32)  # counts fit easily; halves the bytes carried into charts
+        .rename("Total_SDNs")
+    )
 
     # Ensure Risk_Score exists
     if "Risk_Score" not in df.columns:
         # use lightweight aggregation without exploding combinations
-        agg = (
-            df.groupby(["Country", "Sanctions Program"], observed=True)["ent_num"]
-            .nunique()
-            .reset_index(name="Total_SDNs")
-        )
-        agg["Avg_Risk_Score"] = agg["Total_SDNs"].apply(
-            lambda x: 1 if x <= 200 else (2 if x <= 400 else (3 if x <= 600 else (4 if x <= 800 else (5 if x <= 1000 else 6))))
-        )
+        agg = total_sdns.reset_index()
+        agg["Avg_Risk_Score"] = (np.digitize(agg["Total_SDNs"].to_numpy(), SDN_COUNT_SCORE_BINS) + 1).astype(np.int8)
         pivot_df = agg
     else:
-        pivot_df = (
-            df.groupby(["Country", "Sanctions Program"], observed=True)
-            .agg(
-                Total_SDNs=("ent_num", "nunique"),
-                Avg_Risk_Score=("Risk_Score", "mean"),
-            )
-            .reset_index()
-        )
+        avg_risk = df.groupby(keys, observed=True)["Risk_Score"].mean().rename("Avg_Risk_Score")
+        pivot_df = pd.concat([total_sdns, avg_risk], axis=1).fillna({"Total_SDNs": 0}).astype({"Total_SDNs": np.int32}).reset_index()
 
-    # Round risk score
+    # Round risk score; derive the level once here so charts/tables downstream reuse it
     pivot_df["Avg_Risk_Score"] = pivot_df["Avg_Risk_Score"].round(1)
+    pivot_df["Risk_Level"] = pd.Categorical(map_risk_scores_to_levels(pivot_df["Avg_Risk_Score"]), dtype=RISK_LEVEL_DTYPE)
 
     # If dataframe is still too large, truncate for visualization safety
+    # (keep the most material pairs — partial sort, not a random sample that can drop the high-risk tail)
     if len(pivot_df) > 20000:
-        pivot_df = pivot_df.sample(20000, random_state=42)
-        print("[prepare_pivot_data] Pivot truncated to 20k rows for performance safety.")
+        pivot_df = pivot_df.nlargest(20000, "Total_SDNs")
+        print("[prepare_pivot_data] Pivot truncated to the top 20k rows by Total_SDNs for performance safety.")
 
     return pivot_df
 
 
 def generate_program_heatmap(pivot_df: pd.DataFrame) -> go.Figure:
     """Heatmap showing average risk score across country-program combinations."""
-    # use pivot_table to avoid duplicate index errors
-    pivot_heat = pivot_df.pivot_table(index="Country", columns="Sanctions Program", values="Avg_Risk_Score", aggfunc="mean", fill_value=0, observed=False)
+    # pre-aggregate observed (country, program) pairs, then unstack — avoids the dense
+    # Cartesian product pivot_table builds over every category level
+    pivot_heat = (
+        pivot_df.groupby(["Country", "Sanctions Program"], observed=True)["Avg_Risk_Score"]
+        .mean()
+        .unstack(fill_value=0)
+    )
 
-    fig = go.Figure(
-        data=go.Heatmap(
-            z=pivot_heat.values,
-            x=pivot_heat.columns,
-            y=pivot_heat.index,
-            colorscale=[
-                [0.0, RISK_COLOR_MAP["Low"]],
-                [0.2, RISK_COLOR_MAP["Medium Low"]],
-                [0.4, RISK_COLOR_MAP["Medium"]],
-                [0.6, RISK_COLOR_MAP["Medium High"]],
-                [0.8, RISK_COLOR_MAP["High"]],
-                [1.0, RISK_COLOR_MAP["Critical"]],
-            ],
-            zmin=1,
-            zmax=6,
-            colorbar=dict(
-                title="Risk Level (Score)",
-                tickvals=[1,2,3,4,5,6],
-                ticktext=["Low","Med Low","Medium","Med High","High","Critical"]
-            ),
-            xgap=2,  # white border width between cells
-            ygap=2,
-            hovertemplate="<b>%{y}</b><br>Program: %{x}<br>Avg Risk Score: %{z}<extra></extra>",
-        )
+    heatmap_args = dict(
+        z=pivot_heat.values,
+        x=pivot_heat.columns,
+        y=pivot_heat.index,
+        colorscale=RISK_COLORSCALE,
+        zmin=1,
+        zmax=6,
+        colorbar=dict(
+            title="Risk Level (Score)",
+            tickvals=RISK_SCORE_TICKVALS,
+            ticktext=RISK_TICKTEXT
+        ),
     )
-    rg._annotate_heatmap(fig, pivot_heat.values, pivot_heat.columns, pivot_heat.index, font_size=11)
+
+    hovertemplate = "<b>%{y}</b><br>Program: %{x}<br>Avg Risk Score: %{z}<extra></extra>"
+    if pivot_heat.size > LARGE_HEATMAP_MIN_CELLS:
+        # large matrix: no per-cell gaps or text annotations
+        fig = go.Figure(data=go.Heatmap(**heatmap_args, hovertemplate=hovertemplate))
+    else:
+        fig = go.Figure(
+            data=go.Heatmap(
+                **heatmap_args,
+                xgap=2,  # white border width between cells
+                ygap=2,
+                hovertemplate=hovertemplate,
+            )
+        )
+        rg._annotate_heatmap(fig, pivot_heat.values, pivot_heat.columns, pivot_heat.index, font_size=11)
     fig.update_layout(
         title="Cross-Border Sanctions Program Risk Concentration",
         xaxis_title="Sanctions Program",
@@ -180,7 +190,7 @@ def generate_program_bar_chart(
     pivot_df: pd.DataFrame, selected_country=None, selected_program=None
 ) -> go.Figure:
 
-    filtered_df = pivot_df.copy()
+    filtered_df = pivot_df  # boolean filters below yield new frames
     subtitle_parts = []
 
     # Apply filters safely
@@ -211,13 +221,19 @@ def generate_program_bar_chart(
             height=300
         )
 
-    # Create stacked bar
-    fig = px.bar(
-        filtered_df,
-        x="Country",
-        y=y_col,
-        color="Sanctions Program" if "Sanctions Program" in filtered_df.columns else None,
-        title=f"SDN Concentration by Sanctions Program and Country{subtitle}",
+    # Create stacked bar: one go.Bar per program straight from a Country x Program pivot
+    # (columnar arrays; absent pairs stay NaN so they draw no segment, as with px.bar)
+    countries = pd.unique(filtered_df["Country"].to_numpy())
+    if "Sanctions Program" in filtered_df.columns:
+        bars = filtered_df.pivot_table(
+            index="Country", columns="Sanctions Program", values=y_col, aggfunc="sum", observed=True
+        ).reindex(index=countries, columns=pd.unique(filtered_df["Sanctions Program"].to_numpy()))
+    else:
+        bars = filtered_df.groupby("Country", observed=True)[y_col].sum().reindex(countries).to_frame(y_col)
+    x_vals = bars.index.astype(str).to_numpy()
+    fig = go.Figure(
+        [go.Bar(name=str(program), x=x_vals, y=bars[program].to_numpy(dtype=float)) for program in bars.columns],
+        layout=dict(title=f"SDN Concentration by Sanctions Program and Country{subtitle}"),
     )
 
     fig.update_layout(
@@ -237,6 +253,7 @@ def generate_risk_donut_chart(filtered_df: pd.DataFrame, selected_country=None,
         return go.Figure()
     risk_counts = filtered_df["Risk_Level"].value_counts().reset_index()
     risk_counts.columns = ["Risk_Level", "Count"]
+    risk_counts = risk_counts[risk_counts["Count"] > 0]  # categorical value_counts lists unused levels too
     fig = px.pie(risk_counts, names="Risk_Level", values="Count", color="Risk_Level", color_discrete_map=RISK_COLOR_MAP, hole=0.5,
                  title=f"Risk Rating Distribution — {selected_country or 'All'} / {selected_program or 'All'}")
     fig.update_traces(textinfo="percent+label", pull=[0.05]*len(risk_counts))
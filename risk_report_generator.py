@@ -9,6 +9,8 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
 import html
 import re
 from html import unescape
@@ -26,6 +28,11 @@ from config import (
     MAP_PATH,
     RISK_COLOR_MAP,
     RISK_SCORE_MAP,
+    RISK_COLORSCALE,
+    RISK_SCORE_TICKVALS,
+    RISK_TICKTEXT,
+    LARGE_HEATMAP_MIN_CELLS,
+    MAX_ANNOTATED_HEATMAP_CELLS,
     LLM_MODEL_PATH,
     USE_RAG,
     IS_DOCKER,
@@ -125,26 +132,31 @@ def _ensure_numeric(df: pd.DataFrame, col: str, default: float = 0.0) -> pd.Seri
 def _annotate_heatmap(fig: go.Figure, z: np.ndarray, x: list, y: list, font_size: int = 12):
     """
     Add text annotations to a heatmap figure (z matrix) centered in each cell.
+    Skipped for grids above MAX_ANNOTATED_HEATMAP_CELLS.
     """
-    annotations = []
-    for i, yi in enumerate(y):
-        for j, xj in enumerate(x):
-            val = z[i][j]
-            # skip annotation for zero/NaN if you prefer, but show zeros too for clarity
-            txt = str(round(float(val), 2)) if (pd.notna(val)) else ""
-            annotations.append(
-                dict(
-                    x=xj,
-                    y=yi,
-                    text=txt,
-                    showarrow=False,
-                    font=dict(color="white", size=font_size),
-                    xanchor="center",
-                    yanchor="middle",
-                )
-            )
+    if np.size(z) > MAX_ANNOTATED_HEATMAP_CELLS:
+        return
+    # Round / mask / label the whole grid in numpy, then one comprehension over the flat cells.
+    # NaN cells get no annotation; zeros are still shown for clarity.
+    zf = np.round(np.asarray(z, dtype=float), 2)
+    xs, ys = np.meshgrid(np.asarray(x, dtype=object), np.asarray(y, dtype=object))
+    mask = ~np.isnan(zf)
+    font = dict(color="white", size=font_size)
+    annotations = [
+        dict(x=xv, y=yv, text=str(tv), showarrow=False, font=font, xanchor="center", yanchor="middle")
+        for xv, yv, tv in zip(xs[mask].tolist(), ys[mask].tolist(), zf[mask].tolist())
+    ]
     fig.update_layout(annotations=annotations)
 
+def _heatmap_trace(z: np.ndarray, hovertemplate: str, **kwargs):
+    """
+    go.Heatmap with a hover template, plus white cell borders unless the grid exceeds
+    LARGE_HEATMAP_MIN_CELLS.
+    """
+    if np.size(z) > LARGE_HEATMAP_MIN_CELLS:
+        return go.Heatmap(z=z, hovertemplate=hovertemplate, **kwargs)
+    return go.Heatmap(z=z, xgap=2, ygap=2, hovertemplate=hovertemplate, **kwargs)
+
 # ---------------------------
 # Core chart functions
 # ---------------------------
@@ -161,28 +173,35 @@ def generate_donut_chart(df: pd.DataFrame) -> go.Figure:
     fig.update_layout(margin=dict(t=50, b=0, l=0, r=0), height=520)
     return fig
 
+ENTITY_COUNT_COLUMNS = ["Distinct Non-Individuals", "Distinct Individuals", "Total Distinct Entities"]
+
 def generate_stacked_bar(df: pd.DataFrame) -> go.Figure:
-    df = df.sort_values("Total Distinct Entities", ascending=False)
+    # one sort permutation applied to just the plotted arrays, not the whole frame
+    vals = df[ENTITY_COUNT_COLUMNS].to_numpy()
+    order = np.argsort(-vals[:, 2], kind="stable")
+    x = df["Country"].to_numpy()[order]
+    vals = vals[order]
     fig = go.Figure(
         [
-            go.Bar(name="Distinct Non-Individuals", x=df["Country"], y=df["Distinct Non-Individuals"], marker_color="gray"),
-            go.Bar(name="Distinct Individuals", x=df["Country"], y=df["Distinct Individuals"], marker_color="orange"),
-            go.Bar(name="Total Distinct Entities", x=df["Country"], y=df["Total Distinct Entities"], marker_color="blue"),
+            go.Bar(name="Distinct Non-Individuals", x=x, y=vals[:, 0], marker_color="gray"),
+            go.Bar(name="Distinct Individuals", x=x, y=vals[:, 1], marker_color="orange"),
+            go.Bar(name="Total Distinct Entities", x=x, y=vals[:, 2], marker_color="blue"),
         ]
     )
     fig.update_layout(barmode="stack", xaxis_tickangle=-45, height=600, margin=dict(t=50))
     return fig
 
 def generate_percent_stacked(df: pd.DataFrame) -> go.Figure:
-    df = df.copy()
-    total = df[["Distinct Non-Individuals", "Distinct Individuals", "Total Distinct Entities"]].sum(axis=1)
-    for col in ["Distinct Non-Individuals", "Distinct Individuals", "Total Distinct Entities"]:
-        df[f"{col} %"] = (df[col] / total * 100).fillna(0)
+    x = df["Country"].to_numpy()
+    vals = df[ENTITY_COUNT_COLUMNS].to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = vals / vals.sum(axis=1, keepdims=True) * 100
+    pct = np.nan_to_num(pct, nan=0.0, posinf=np.inf, neginf=-np.inf)
     fig = go.Figure(
         [
-            go.Bar(name="Total Entities %", x=df["Country"], y=df["Total Distinct Entities %"], marker_color="blue"),
-            go.Bar(name="Individuals %", x=df["Country"], y=df["Distinct Individuals %"], marker_color="orange"),
-            go.Bar(name="Non-Individuals %", x=df["Country"], y=df["Distinct Non-Individuals %"], marker_color="gray"),
+            go.Bar(name="Total Entities %", x=x, y=pct[:, 2], marker_color="blue"),
+            go.Bar(name="Individuals %", x=x, y=pct[:, 1], marker_color="orange"),
+            go.Bar(name="Non-Individuals %", x=x, y=pct[:, 0], marker_color="gray"),
         ]
     )
     # legend placed under the chart
@@ -219,24 +238,15 @@ def generate_risk_heatmap(df: pd.DataFrame) -> go.Figure:
 
     # heatmap
     fig = go.Figure(
-        data=go.Heatmap(
-            z=z,
+        data=_heatmap_trace(
+            z,
             x=x_labels,
             y=y_labels,
-            colorscale=[
-                [0.0, RISK_COLOR_MAP["Low"]],
-                [0.2, RISK_COLOR_MAP["Medium Low"]],
-                [0.4, RISK_COLOR_MAP["Medium"]],
-                [0.6, RISK_COLOR_MAP["Medium High"]],
-                [0.8, RISK_COLOR_MAP["High"]],
-                [1.0, RISK_COLOR_MAP["Critical"]],
-            ],
+            colorscale=RISK_COLORSCALE,
             zmin=1,
             zmax=6,
             showscale=True,
-            colorbar=dict(title="Risk Level (Score)", tickvals=[1,2,3,4,5,6], ticktext=["Low","Med Low","Med","Med High","High","Critical"]),
-            xgap=2,  # white border width between cells
-            ygap=2,
+            colorbar=dict(title="Risk Level (Score)", tickvals=RISK_SCORE_TICKVALS, ticktext=RISK_TICKTEXT),
             hovertemplate="<b>%{y}</b><br>Risk Type: %{x}<br>Avg Risk Score: %{z}<extra></extra>",
         )
     )
@@ -293,29 +303,24 @@ def generate_program_heatmap(pivot_df: pd.DataFrame) -> go.Figure:
     if val_col is None:
         raise ValueError("pivot_df must contain 'Avg_Risk_Score' or 'SDN_Count'")
 
-    pivot_heat = pivot_df.pivot_table(index="Country", columns="Sanctions Program", values=val_col, aggfunc="mean", fill_value=0)
+    pivot_heat = (
+        pivot_df.groupby(["Country", "Sanctions Program"], observed=True)[val_col]
+        .mean()
+        .unstack(fill_value=0)
+    )
     x_labels = pivot_heat.columns.tolist()
     y_labels = pivot_heat.index.tolist()
     z = pivot_heat.values.astype(float)
 
     fig = go.Figure(
-        data=go.Heatmap(
-            z=z,
+        data=_heatmap_trace(
+            z,
             x=x_labels,
             y=y_labels,
-            colorscale=[
-                [0.0, RISK_COLOR_MAP["Low"]],
-                [0.2, RISK_COLOR_MAP["Medium Low"]],
-                [0.4, RISK_COLOR_MAP["Medium"]],
-                [0.6, RISK_COLOR_MAP["Medium High"]],
-                [0.8, RISK_COLOR_MAP["High"]],
-                [1.0, RISK_COLOR_MAP["Critical"]],
-            ],
+            colorscale=RISK_COLORSCALE,
             zmin=z.min() if z.size else 0,
             zmax=z.max() if z.size else 1,
             colorbar=dict(title=f"{val_col} (aggregated)"),
-            xgap=2,
-            ygap=2,
             hovertemplate="<b>%{y}</b><br>Program: %{x}<br>Value: %{z}<extra></extra>",
         )
     )
@@ -334,8 +339,12 @@ def generate_program_heatmap(pivot_df: pd.DataFrame) -> go.Figure:
 # ---------------------------
 # Data story generator
 # ---------------------------
+_TAG_RE = re.compile(r"<[^>]+>")
+
 def remove_non_ascii(text: str) -> str:
     """Remove or replace non-ASCII characters safely for PDF export."""
+    if text.isascii():  # common case: nothing to strip, skip the encode/decode copies
+        return text
     return text.encode("ascii", "ignore").decode("ascii")
 
 def create_pdf_from_html(story_html: str, pdf_path: str):
@@ -357,19 +366,21 @@ def create_pdf_from_html(story_html: str, pdf_path: str):
         pdf.set_font("Helvetica", "", 12)
 
     # --- Clean HTML and write ---
-    plain = re.sub(r"<[^>]+>", "", story_html)  # remove HTML tags
-    plain = unescape(plain)
+    # each rewrite only runs when its input can need it (remove_non_ascii has an isascii() exit);
+    # kept as separate C-level passes — a single alternation regex or a per-char state machine
+    # measured several times slower on story-sized HTML
+    plain = _TAG_RE.sub("", story_html) if "<" in story_html else story_html  # remove HTML tags
+    plain = unescape(plain) if "&" in plain else plain
     plain = remove_non_ascii(plain)
 
-    for line in plain.split("\n"):
-        try:
-            pdf.multi_cell(0, 7, line)
-        except Exception:
-            pdf.multi_cell(0, 7, remove_non_ascii(line))
+    # multi_cell breaks on embedded newlines itself
+    pdf.multi_cell(0, 7, plain)
 
-    pdf.output(pdf_path)
+    # build the document in memory, then write it with one buffered call
+    with open(pdf_path, "wb", buffering=1 << 20) as f:
+        f.write(bytes(pdf.output()))
     return pdf_path
-    
+
 def generate_data_story(df_filtered: pd.DataFrame) -> str:
     """
     Build an executive-style, dynamic data story from filtered metrics/master data.
@@ -379,17 +390,14 @@ def generate_data_story(df_filtered: pd.DataFrame) -> str:
     if df_filtered is None or df_filtered.empty:
         return "<p><em>No data available to generate a data story.</em></p>"
 
-    # Work on a copy
-    df = df_filtered.copy()
-
-    # Ensure counts numeric
-    df["Total Distinct Entities"] = pd.to_numeric(df.get("Total Distinct Entities", 0), errors="coerce").fillna(0).astype(int)
-    df["Distinct Individuals"] = pd.to_numeric(df.get("Distinct Individuals", 0), errors="coerce").fillna(0).astype(int)
-    df["Distinct Non-Individuals"] = pd.to_numeric(df.get("Distinct Non-Individuals", 0), errors="coerce").fillna(0).astype(int)
+    # Ensure counts numeric (missing columns count as 0)
+    count_cols = ["Distinct Individuals", "Distinct Non-Individuals", "Total Distinct Entities"]
+    counts = df_filtered.reindex(columns=count_cols).apply(pd.to_numeric, errors="coerce").fillna(0).astype(np.int32)
+    df = df_filtered.assign(**counts)
 
     # Top 5 countries
-    top5 = df.nlargest(5, "Total Distinct Entities")[["Country", "Total Distinct Entities"]]
-    top5_list = ", ".join(f"{r.Country} ({int(r['Total Distinct Entities'])})" for _, r in top5.iterrows())
+    top5 = df.nlargest(5, "Total Distinct Entities")
+    top5_list = ", ".join(f"{c} ({int(n)})" for c, n in zip(top5["Country"], top5["Total Distinct Entities"]))
 
     # Dominant risk rating
     if "Rating - Personal & Non-Personal" in df.columns:
@@ -401,18 +409,18 @@ def generate_data_story(df_filtered: pd.DataFrame) -> str:
         dominant_risk = None
         dominant_share = 0
 
-    total_entities = df["Total Distinct Entities"].sum()
-    individuals = df["Distinct Individuals"].sum()
-    non_individuals = df["Distinct Non-Individuals"].sum()
+    individuals, non_individuals, total_entities = counts.to_numpy().sum(axis=0)
     indiv_pct = (individuals / total_entities * 100) if total_entities > 0 else 0
     nonind_pct = (non_individuals / total_entities * 100) if total_entities > 0 else 0
 
     avg_risk_score = None
     # attempt to compute average risk score if present
-    if "Rating - Personal & Non-Personal" in df.columns:
+    if "Rating - Personal & Non-Personal Score" in df.columns:
+        # score column precomputed by compute_country_risk_metrics
+        avg_risk_score = df["Rating - Personal & Non-Personal Score"].mean()
+    elif "Rating - Personal & Non-Personal" in df.columns:
         # map rating -> score and compute weighted average
-        df["__score__"] = df["Rating - Personal & Non-Personal"].map(RISK_SCORE_MAP).fillna(0)
-        avg_risk_score = df["__score__"].mean()
+        avg_risk_score = df["Rating - Personal & Non-Personal"].map(RISK_SCORE_MAP).fillna(0).mean()
 
     # build markdown story (escaped where needed)
     story_lines = []
@@ -441,31 +449,75 @@ def generate_data_story(df_filtered: pd.DataFrame) -> str:
 # HTML report (data story above charts)
 # ---------------------------
 
+_MATRIX_COUNT_COLUMNS = ["Country", "Total Distinct Entities", "Distinct Individuals", "Distinct Non-Individuals"]
+_MATRIX_RATING_COLUMNS = ["Rating - Personal & Non-Personal", "Rating - Personal", "Rating - Non-Personal"]
+_MATRIX_TH_STYLE = "background-color: #1f4e78; color: white; font-weight: bold;"
+_MATRIX_COUNT_STYLE = "background-color: #c9edff; text-align:center;"
+
 def generate_risk_matrix_html(df: pd.DataFrame) -> str:
-    display_df = df[["Country","Total Distinct Entities","Distinct Individuals","Distinct Non-Individuals",
-                     "Rating - Personal & Non-Personal","Rating - Personal","Rating - Non-Personal"]].copy()
+    """
+    Risk matrix as an HTML table: count columns on a light-blue background, rating
+    columns colored via RISK_COLOR_MAP. Cells are built column-wise as strings and
+    joined once per row, instead of a Styler callback per cell.
+    """
+    display_df = df[_MATRIX_COUNT_COLUMNS + _MATRIX_RATING_COLUMNS]
+
+    def _text(values) -> np.ndarray:
+        return np.array([html.escape(str(v)) for v in values], dtype=object)
+
+    cell_cols = [f'<tr><th style="{_MATRIX_TH_STYLE}">' + _text(display_df.index) + "</th>"]
+    for col in _MATRIX_COUNT_COLUMNS:
+        cell_cols.append(f'<td style="{_MATRIX_COUNT_STYLE}">' + _text(display_df[col]) + "</td>")
+    for col in _MATRIX_RATING_COLUMNS:
+        ratings = display_df[col].astype(object)
+        colors = ratings.map(RISK_COLOR_MAP).fillna("#FFFFFF").to_numpy(dtype=object)
+        cell_cols.append(
+            '<td style="background-color: ' + colors + '; text-align:center; color:black;">' + _text(ratings) + "</td>"
+        )
+    cell_cols.append(np.full(len(display_df), "</tr>", dtype=object))
 
-    def base_color(val): return "background-color: #c9edff; text-align:center;"
-    def risk_color(val): return f"background-color: {RISK_COLOR_MAP.get(val, '#FFFFFF')}; text-align:center; color:black;"
+    header = "".join(f'<th style="{_MATRIX_TH_STYLE}">{html.escape(c)}</th>' for c in display_df.columns)
+    rows = "\n".join(map("".join, zip(*cell_cols)))
+    return (
+        f'<table>\n<thead>\n<tr><th style="{_MATRIX_TH_STYLE}">&nbsp;</th>{header}</tr>\n</thead>\n'
+        f"<tbody>\n{rows}\n</tbody>\n</table>\n"
+    )
+
+# Same plotly.js build that to_html(include_plotlyjs="cdn") would reference
+PLOTLYJS_CDN_URL = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
 
-    styled = (
-        display_df.style
-        .map(base_color, subset=["Country","Total Distinct Entities","Distinct Individuals","Distinct Non-Individuals"])
-        .map(risk_color, subset=["Rating - Personal & Non-Personal","Rating - Personal","Rating - Non-Personal"])
-        .set_table_styles([{"selector": "th", "props": [("background-color","#1f4e78"),("color","white"),("font-weight","bold")]}])
+def _figure_div(fig: go.Figure, div_id: str) -> str:
+    """
+    Embed a figure as a div plus a Plotly.newPlot call on its JSON spec.
+    Skips to_html's validation and template pass (figures here are built programmatically).
+    """
+    fig_json = pio.to_json(fig, validate=False)
+    return (
+        f'<div id="{div_id}"></div>\n'
+        f'<script src="{PLOTLYJS_CDN_URL}" charset="utf-8"></script>\n'
+        f'<script>(function(){{ var spec = {fig_json}; '
+        f'Plotly.newPlot("{div_id}", spec.data, spec.layout, {{"responsive": true}}); }})();</script>'
     )
-    return styled.to_html(escape=False, index=False)
 
-def generate_ofac_risk_report(df: pd.DataFrame, export_path: Optional[str]=None) -> Tuple[str, go.Figure]:
+def generate_ofac_risk_report(
+    df: pd.DataFrame,
+    export_path: Optional[str]=None,
+    precomputed: Optional[dict]=None,
+    story: Optional[str]=None,
+) -> Tuple[str, go.Figure]:
     """
     Returns HTML content and the heatmap figure.
     The data story is embedded ABOVE the charts (as requested).
+    `precomputed` (chart dict with a "risk_heatmap" figure) and `story` (data story HTML)
+    let callers that already built them skip recomputation.
     """
     # create html pieces
-    data_story_html = generate_data_story(df)
+    data_story_html = story if story is not None else generate_data_story(df)
     html_table = generate_risk_matrix_html(df)
-    heatmap_fig = generate_risk_heatmap(df)
-    heatmap_html = heatmap_fig.to_html(full_html=False, include_plotlyjs="cdn")
+    heatmap_fig = (precomputed or {}).get("risk_heatmap")
+    if heatmap_fig is None:
+        heatmap_fig = generate_risk_heatmap(df)
+    heatmap_html = _figure_div(heatmap_fig, "risk-heatmap")
 
     html_content = f"""
     <html>
@@ -0,0 +1,140 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processor as dp
+
+
+@pytest.fixture
+def master_df():
+    # ties on purpose: B and C both have 2 entities, A has 3; one null program, one null ent_num
+    return pd.DataFrame({
+        "ent_num": [1, 2, 3, 3, 4, 8, 5, 6, 7, None],
+        "Sanctions Program": ["C", "C", "A", "A", "A", "A", "B", "B", None, "A"],
+    })
+
+
+@pytest.mark.parametrize("program_dtype", ["object", "string", "category"])
+def test_compute_program_totals_polars_matches_pandas(monkeypatch, master_df, program_dtype):
+    pytest.importorskip("polars")
+    df = master_df.astype({"Sanctions Program": program_dtype})
+    fast = dp.compute_program_totals(df)
+    monkeypatch.setattr(dp, "pl", None)
+    fallback = dp.compute_program_totals(df)
+    pd.testing.assert_frame_equal(fast, fallback)
+
+
+def test_compute_program_totals_pandas_order(monkeypatch, master_df):
+    monkeypatch.setattr(dp, "pl", None)
+    out = dp.compute_program_totals(master_df)
+    assert out["Sanctions Program"].tolist() == ["A", "B", "C"]
+    assert out["Total Distinct Entities"].tolist() == [3, 2, 2]
+    assert out["Total Distinct Entities"].dtype == "int64"
+
+
+@pytest.fixture
+def sdn_master():
+    return pd.DataFrame({
+        "ent_num": [1, 1, 2, 3, 4, 5, 5, 6, None],
+        "SDN_Type": ["individual", "individual", "Entity", "INDIVIDUAL", "vessel", None, None, "entity", "individual"],
+        "Country": ["Cuba", "Iran", "Cuba", "Cuba", "Iran", "Iran", "Iran", "Syria", "Cuba"],
+    })
+
+
+def _metrics_by_nunique(df):
+    """Per-country nunique counts, computed the way the original three-groupby version did."""
+    is_ind = df["SDN_Type"].fillna("").str.lower() == "individual"
+    total = df.groupby("Country")["ent_num"].nunique().rename("Total Distinct Entities")
+    inds = df[is_ind].groupby("Country")["ent_num"].nunique().rename("Distinct Individuals")
+    non_inds = df[~is_ind].groupby("Country")["ent_num"].nunique().rename("Distinct Non-Individuals")
+    return pd.concat([total, inds, non_inds], axis=1).fillna(0).astype(int).sort_index()
+
+
+COUNT_COLUMNS = ["Total Distinct Entities", "Distinct Individuals", "Distinct Non-Individuals"]
+
+
+def test_compute_country_risk_metrics_matches_nunique(sdn_master):
+    metrics = dp.compute_country_risk_metrics(sdn_master).set_index("Country")[COUNT_COLUMNS]
+    pd.testing.assert_frame_equal(metrics.sort_index(), _metrics_by_nunique(sdn_master), check_names=False)
+
+
+def test_compute_country_risk_metrics_categorical_subset_only_observed(sdn_master):
+    df = sdn_master.astype({"Country": pd.CategoricalDtype(["Cuba", "Iran", "Syria", "Yemen"])})
+    subset = df[df["Country"].isin(["Cuba", "Iran"])]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        metrics = dp.compute_country_risk_metrics(subset)
+    assert metrics["Country"].tolist() == ["Cuba", "Iran"]
+
+
+def test_metrics_threaded_matches_inline(monkeypatch, sdn_master):
+    pairs = dp._country_entity_pairs(sdn_master)
+    inline = dp._metrics_from_entity_pairs(pairs)
+    monkeypatch.setattr(dp, "PARALLEL_GROUPBY_MIN_ROWS", 0)
+    threaded = dp._metrics_from_entity_pairs(pairs)
+    pd.testing.assert_frame_equal(threaded, inline)
+
+
+def _nearest_by_min_scan(score):
+    """The original per-value lookup: min() over the score map by absolute distance."""
+    nearest = min(dp.RISK_SCORE_MAP.values(), key=lambda x: abs(x - score))
+    return next(level for level, s in dp.RISK_SCORE_MAP.items() if s == nearest)
+
+
+@pytest.mark.parametrize("score", [0.0, 1.0, 1.5, 2.2, 3.5, 4.49, 5.5, 6.0, 7.3, float("nan")])
+def test_nearest_risk_level_scalar_matches_min_scan(score):
+    assert dp.nearest_risk_level(score) == _nearest_by_min_scan(score)
+
+
+def test_nearest_risk_level_array_nan():
+    scores = [1.0, float("nan"), 6.0]
+    expected = [_nearest_by_min_scan(s) for s in scores]
+    assert dp.nearest_risk_level(scores).tolist() == expected
+    assert expected[1] == "Low"
+
+
+def test_downcast_dtypes_keeps_scores_float64():
+    df = pd.DataFrame({
+        "ent_num": ["1", "2", "3"],
+        "Risk_Score": [1.1, 2.7, 3.35],
+        "Weight": [0.5, 1.25, 2.0],
+        "Count": [1.0, 2.0, None],
+    })
+    out = dp.downcast_dtypes(df.copy())
+    assert out["Risk_Score"].dtype == np.float64
+    assert out["Risk_Score"].mean().round(2) == df["Risk_Score"].mean().round(2)
+    assert out["Weight"].dtype == np.float32
+    assert str(out["Count"].dtype) == "Int8"
+    assert str(out["ent_num"].dtype) == "int8"
+
+
+def test_run_cached_pipeline_matches_uncached(tmp_path):
+    pytest.importorskip("pyarrow")
+    sources = (dp.SDN_PATH, dp.ADD_PATH, dp.MAP_PATH)
+    if not all(os.path.exists(p) for p in sources):
+        pytest.skip("default OFAC CSVs not present")
+    metrics, aggregated, master = dp.run_ofac_data_pipeline(*sources)
+
+    cold = dp.run_cached_ofac_data_pipeline(*sources, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.glob("master_*.feather"))) == 1
+    warm = dp.run_cached_ofac_data_pipeline(*sources, cache_dir=str(tmp_path))
+
+    for result in (cold, warm):
+        pd.testing.assert_frame_equal(result[0], metrics)
+        pd.testing.assert_frame_equal(result[1], aggregated)
+        assert result[2].shape == master.shape
+
+
+def test_run_cached_pipeline_prunes_stale_files(tmp_path):
+    pytest.importorskip("pyarrow")
+    sources = (dp.SDN_PATH, dp.ADD_PATH, dp.MAP_PATH)
+    if not all(os.path.exists(p) for p in sources):
+        pytest.skip("default OFAC CSVs not present")
+    stale = tmp_path / "master_0_0_0.feather"
+    stale.write_bytes(b"stale")
+    dp.run_cached_ofac_data_pipeline(*sources, cache_dir=str(tmp_path))
+    assert not stale.exists()
+    assert len(list(tmp_path.glob("master_*.feather"))) == 1
@@ -0,0 +1,73 @@
+import io
+
+import plotly.graph_objects as go
+import pytest
+
+from utils import pdf_utils as pu
+
+
+def _png_bytes(fig, fmt="png", *args, **kwargs):
+    # stands in for Kaleido: a small solid image in the requested format
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", (72, 48), "white").save(buf, "JPEG" if fmt == "jpeg" else "PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def sections():
+    return [
+        {"title": "Overview", "content": "Summary text here"},
+        {"title": "Programs", "figure": go.Figure(go.Bar(x=["A", "B"], y=[1, 2]))},
+        {},
+    ]
+
+
+@pytest.fixture(autouse=True)
+def fake_renderer(monkeypatch):
+    monkeypatch.setattr(pu, "fig_to_bytes", _png_bytes)
+    pu._IMAGE_CACHE.clear()
+
+
+def _pdf_text_and_images(path):
+    pymupdf = pytest.importorskip("pymupdf")
+    with pymupdf.open(path) as doc:
+        return "".join(page.get_text() for page in doc), sum(len(page.get_images()) for page in doc)
+
+
+@pytest.mark.parametrize("writer", ["pymupdf", "fpdf"])
+def test_create_combined_pdf_writers_agree(monkeypatch, tmp_path, sections, writer):
+    if writer == "pymupdf":
+        pytest.importorskip("pymupdf")
+    else:
+        monkeypatch.setattr(pu, "pymupdf", None)
+    path = pu.create_combined_pdf(sections, str(tmp_path / f"{writer}.pdf"))
+    text, images = _pdf_text_and_images(path)
+    for expected in ("Overview", "Summary text here", "Programs"):
+        assert expected in text
+    assert images == 1
+
+
+def test_create_combined_pdf_rejects_empty(tmp_path):
+    with pytest.raises(ValueError):
+        pu.create_combined_pdf([{}, {"title": ""}], str(tmp_path / "empty.pdf"))
+
+
+HTML_CASES = [
+    ("", ""),
+    ("plain text", "plain text"),
+    ("Fish &amp; Chips", "Fish & Chips"),
+    ("<p>Risk <b>High</b></p>", "Risk High"),
+    ("<div>A &lt; B</div>", "A < B"),
+]
+
+
+@pytest.mark.parametrize("html, expected", HTML_CASES)
+@pytest.mark.parametrize("parser", ["lexbor", "regex"])
+def test_html_to_text_parsers_agree(monkeypatch, parser, html, expected):
+    if parser == "lexbor":
+        if pu.LexborHTMLParser is None:
+            pytest.skip("selectolax not installed")
+    else:
+        monkeypatch.setattr(pu, "LexborHTMLParser", None)
+    assert pu.html_to_text(html) == expected
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+import pivot_risk_visuals as pv
+
+
+def _level_by_thresholds(score):
+    """Scalar if/elif ladder the vectorized bucketing replaced."""
+    if pd.isna(score):
+        return "Unknown"
+    for edge, label in zip(pv.RISK_LEVEL_EDGES, pv.RISK_LEVEL_LABELS):
+        if score < edge:
+            return label
+    return "Critical"
+
+
+def test_map_risk_scores_to_levels_matches_threshold_ladder():
+    scores = np.array([0.0, 1.0, 1.49, 1.5, 2.5, 3.49, 3.5, 4.5, 5.49, 5.5, 6.0, 9.0, np.nan])
+    expected = [_level_by_thresholds(s) for s in scores]
+    assert pv.map_risk_scores_to_levels(scores).tolist() == expected
+
+
+def test_map_risk_score_to_level_scalar():
+    assert pv.map_risk_score_to_level(3.0) == "Medium"
+    assert pv.map_risk_score_to_level(float("nan")) == "Unknown"
@@ -1,37 +1,151 @@
+import hashlib
+import io
 import os
 import re
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import plotly.io as pio
 from fpdf import FPDF
 from html import unescape
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF is optional — fall back to FPDF
+    pymupdf = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax is optional — fall back to regex tag stripping + unescape
+    LexborHTMLParser = None
+
+# Compiled once at import; the helpers below reuse them per call
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7F]+")
+_TAG_RE = re.compile(r"<[^>]+>")
+
 # ------------------------------------------------------------
 # Utility: clean non-ASCII text (prevents FPDF encoding errors)
 # ------------------------------------------------------------
 def remove_non_ascii(text: str) -> str:
     if not isinstance(text, str):
         return ""
-    return re.sub(r"[^\x00-\x7F]+", " ", text)
+    if text.isascii():  # C-level check; plain English text never reaches the regex
+        return text
+    return _NON_ASCII_RE.sub(" ", text)
+
+# Latin-1 byte -> itself if ASCII, else a space
+_ASCII_BYTE_TABLE = bytes(c if c < 0x80 else 0x20 for c in range(256))
+
+def remove_non_ascii_bytes(text: str) -> str:
+    """
+    Byte-level scrub for Helvetica (Latin-1) output: one space per non-ASCII Latin-1
+    character, "?" for characters outside Latin-1. A single C translate pass, no regex.
+    """
+    if not isinstance(text, str):
+        return ""
+    if text.isascii():
+        return text
+    return text.encode("latin-1", "replace").translate(_ASCII_BYTE_TABLE).decode("ascii")
 
 
 # ------------------------------------------------------------
-# Utility: save Plotly figure to temporary PNG image
+# Utility: render Plotly figure to in-memory image bytes
 # ------------------------------------------------------------
-def save_fig_to_temp(fig):
-    temp_path = tempfile.NamedTemporaryFile(delete=False, suffix=".png").name
-    pio.write_image(fig, temp_path)
-    return temp_path
+# Render size for the 180 mm PDF figure slot (~100 dpi), close to Kaleido's default
+FIGURE_IMAGE_WIDTH = 720
+FIGURE_IMAGE_HEIGHT = 480
+# Continuous-color figures compress far better as JPEG than PNG
+JPEG_FIGURE_KINDS = {"heatmap", "heatmapgl"}
+
+def fig_to_bytes(fig, fmt: str = "png", width: int = FIGURE_IMAGE_WIDTH,
+                 height: int = FIGURE_IMAGE_HEIGHT, scale: float = 1) -> bytes:
+    return pio.to_image(fig, format=fmt, width=width, height=height, scale=scale)
+
+def _figure_format(section: dict) -> str:
+    """JPEG for heatmap sections (explicit "figure_kind" or a heatmap first trace), PNG otherwise."""
+    kind = section.get("figure_kind")
+    if kind is None:
+        data = section["figure"].data
+        kind = data[0].type if data else None
+    return "jpeg" if kind in JPEG_FIGURE_KINDS else "png"
+
+# Figures render on worker threads while the PDF text is being written
+FIGURE_RENDER_WORKERS = 4
+
+@contextmanager
+def _kaleido_session():
+    """Hold one Kaleido >= 1.0 sync server for the block; older Kaleido keeps its own process alive."""
+    try:
+        import kaleido
+    except ImportError:
+        kaleido = None
+    use_server = kaleido is not None and hasattr(kaleido, "start_sync_server")
+    if use_server:
+        kaleido.start_sync_server()
+    try:
+        yield
+    finally:
+        if use_server:
+            kaleido.stop_sync_server()
+
+# Rendered images keyed by (figure spec digest, format), shared across PDFs (oldest evicted first)
+_IMAGE_CACHE: dict = {}
+_IMAGE_CACHE_SIZE = 32
+_IMAGE_CACHE_LOCK = threading.Lock()
+
+def _figure_digest(fig) -> bytes:
+    return hashlib.blake2b(pio.to_json(fig, validate=False).encode("utf-8"), digest_size=16).digest()
+
+def _cached_image(key: tuple, fig) -> bytes:
+    with _IMAGE_CACHE_LOCK:
+        image = _IMAGE_CACHE.get(key)
+    if image is None:
+        image = fig_to_bytes(fig, key[1])
+        with _IMAGE_CACHE_LOCK:
+            if len(_IMAGE_CACHE) >= _IMAGE_CACHE_SIZE:
+                _IMAGE_CACHE.pop(next(iter(_IMAGE_CACHE)))
+            _IMAGE_CACHE[key] = image
+    return image
+
+def submit_figure_renders(sections, executor) -> dict:
+    """
+    Queue one image render per distinct (figure spec, format); returns futures keyed by
+    section index. Figures with identical JSON share a single render, and specs rendered
+    for an earlier PDF come straight from the image cache.
+    """
+    futures = {}
+    by_key = {}
+    for i, section in enumerate(sections):
+        fig = section.get("figure")
+        if fig is None:
+            continue
+        key = (_figure_digest(fig), _figure_format(section))
+        if key not in by_key:
+            by_key[key] = executor.submit(_cached_image, key, fig)
+        futures[i] = by_key[key]
+    return futures
 
 def html_to_text(html: str) -> str:
     """
     Convert HTML string to plain text for PDF output.
     - Strips all HTML tags
     - Unescapes HTML entities
+    Each step only runs when its marker character ("<" / "&") occurs at all. Markup is
+    parsed in one native pass by selectolax (lexbor) when installed, which also drops
+    <script>/<style> bodies and decodes entities.
     """
     if not html:
         return ""
-    text = re.sub(r"<[^>]+>", "", html)  # naive tag stripping
-    text = unescape(text)                # decode & unescape entities
-    return text
+    has_tag = "<" in html
+    has_ent = "&" in html
+    if not has_tag and not has_ent:
+        return html
+    if has_tag and LexborHTMLParser is not None:
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(["script", "style"])
+        return tree.text()
+    text = _TAG_RE.sub("", html) if has_tag else html  # naive tag stripping
+    return unescape(text) if has_ent else text          # decode & unescape entities
     
 # ------------------------------------------------------------
 # Main: create combined PDF with text + figures
@@ -47,41 +161,194 @@ def create_combined_pdf(sections, pdf_path: str):
                 {"title": "SDN Risk Heatmap", "figure": fig1},
                 {"title": "Country Breakdown", "figure": fig2},
             ]
+            An optional "figure_kind" ("heatmap", ...) picks the image format;
+            heatmaps are embedded as JPEG, everything else as PNG.
         pdf_path (str): destination file path for PDF
+
+    Uses PyMuPDF (native text/image insertion) when installed, FPDF otherwise.
+    With PyMuPDF, long reports are laid out PDF_SECTION_BATCH sections at a time and
+    the parts merged at the end, so only one batch of figures is held in memory.
+
+    Sections with no title, content or figure are skipped. Raises ValueError when
+    nothing is left to write, before any writer or Kaleido session is started.
     """
+    sections = [
+        s for s in sections
+        if s.get("title") or s.get("content") or s.get("figure") is not None
+    ]
+    if not sections:
+        raise ValueError("create_combined_pdf: no sections with a title, content or figure")
+    if pymupdf is not None:
+        render, batch_size = _render_pdf_pymupdf, PDF_SECTION_BATCH
+    else:
+        render, batch_size = _render_pdf_fpdf, len(sections)  # no merger without PyMuPDF
+
+    parts = []
+    with _kaleido_session(), ThreadPoolExecutor(max_workers=FIGURE_RENDER_WORKERS) as executor:
+        for start in range(0, len(sections), batch_size):
+            batch = sections[start:start + batch_size]
+            parts.append(render(batch, submit_figure_renders(batch, executor)))
+
+    _write_pdf_bytes(pdf_path, parts[0] if len(parts) == 1 else _merge_pdf_parts(parts))
+    return pdf_path
+
+# Sections laid out per PDF part; bounds the figure bytes and layout state alive at once
+PDF_SECTION_BATCH = 100
+
+def _merge_pdf_parts(parts: list) -> bytes:
+    """Concatenate PDF parts (bytes) with PyMuPDF, releasing each part once it is copied."""
+    merged = pymupdf.open()
+    try:
+        for i in range(len(parts)):
+            part, parts[i] = parts[i], None
+            with pymupdf.open(stream=part, filetype="pdf") as src:
+                merged.insert_pdf(src)
+        return merged.tobytes(deflate=True)
+    finally:
+        merged.close()
+
+# Finished PDFs are written in one buffered call rather than the writers' own file output
+PDF_WRITE_BUFFER = 1 << 20
+
+def _write_pdf_bytes(pdf_path: str, data: bytes):
+    with open(pdf_path, "wb", buffering=PDF_WRITE_BUFFER) as f:
+        f.write(data)
+
+# Bundled Unicode font for FPDF body text (same file risk_report_generator embeds)
+FONT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fonts", "DejaVuSans.ttf")
+
+def _render_pdf_fpdf(sections, futures: dict) -> bytes:
+    """Pure-Python FPDF writer (used when PyMuPDF is not installed)."""
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
-    pdf.set_font("Helvetica", size=12)
 
-    for section in sections:
+    # Fonts are registered once; set_font is only issued when the style actually changes
+    title_font = ("Helvetica", "B", 14)
+    body_font = ("Helvetica", "", 12)
+    unicode_body = os.path.exists(FONT_PATH)
+    if unicode_body:
+        pdf.add_font("DejaVu", "", FONT_PATH)
+        body_font = ("DejaVu", "", 12)
+    current_font = None
+
+    def use_font(font):
+        nonlocal current_font
+        if font != current_font:
+            pdf.set_font(*font)
+            current_font = font
+
+    for i, section in enumerate(sections):
         title = section.get("title", "")
         content = section.get("content")
         fig = section.get("figure")
 
         # Section title
         if title:
-            pdf.set_font("Helvetica", "B", 14)
+            use_font(title_font)
             pdf.cell(0, 10, title, ln=True)
             pdf.ln(3)
-            pdf.set_font("Helvetica", size=12)
 
         # Add text content
         if content:
-            clean_text = remove_non_ascii(content)
+            use_font(body_font)
+            # DejaVu covers the text as-is; only the Latin-1 core font needs the ASCII scrub
+            clean_text = content if unicode_body else remove_non_ascii(content)
             pdf.multi_cell(0, 8, clean_text)
             pdf.ln(5)
 
         # Add figure as image
         if fig is not None:
             try:
-                fig_path = save_fig_to_temp(fig)
-                pdf.image(fig_path, w=180)
-                os.remove(fig_path)
+                pdf.image(io.BytesIO(futures[i].result()), w=180)
                 pdf.ln(10)
             except Exception as e:
+                use_font(body_font)
                 pdf.multi_cell(0, 8, f"[⚠️ Could not render figure: {e}]")
                 pdf.ln(5)
 
-    pdf.output(pdf_path)
-    return pdf_path
+    return bytes(pdf.output())
+
+# Page geometry shared with the FPDF layout (A4, mm converted to PDF points)
+_MM = 72 / 25.4
+_PAGE_MARGIN = 10 * _MM
+_BOTTOM_MARGIN = 15 * _MM
+_FIGURE_WIDTH = 180 * _MM
+
+def _wrap_text(text: str, fontname: str, fontsize: float, width: float) -> list:
+    """Greedy word wrap of text into lines no wider than width (explicit newlines kept)."""
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if line and pymupdf.get_text_length(candidate, fontname=fontname, fontsize=fontsize) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+def _render_pdf_pymupdf(sections, futures: dict) -> bytes:
+    """PyMuPDF writer: text and images are inserted by native code, image bytes go in as streams."""
+    doc = pymupdf.open()
+    try:  # release the native document even when layout or serialization fails
+        _layout_pymupdf(doc, sections, futures)
+        return doc.tobytes(deflate=True)
+    finally:
+        doc.close()
+
+def _layout_pymupdf(doc, sections, futures: dict):
+    page = doc.new_page()
+    x0 = _PAGE_MARGIN
+    text_width = page.rect.width - 2 * _PAGE_MARGIN
+    bottom = page.rect.height - _BOTTOM_MARGIN
+    y = _PAGE_MARGIN
+
+    def reserve(height: float):
+        nonlocal page, y
+        if y + height > bottom:
+            page = doc.new_page()
+            y = _PAGE_MARGIN
+
+    def write(text: str, fontname: str = "helv", fontsize: float = 12, line_height: float = 8 * _MM):
+        # all lines that fit on the current page go out as one text block (one font selection)
+        nonlocal y
+        lines = _wrap_text(text, fontname, fontsize, text_width)
+        while lines:
+            reserve(line_height)
+            fit = max(1, int((bottom - y) // line_height))
+            block, lines = lines[:fit], lines[fit:]
+            page.insert_text(
+                (x0, y + fontsize), block, fontname=fontname, fontsize=fontsize, lineheight=line_height / fontsize
+            )
+            y += len(block) * line_height
+
+    for i, section in enumerate(sections):
+        title = section.get("title", "")
+        content = section.get("content")
+        fig = section.get("figure")
+
+        # Section title
+        if title:
+            write(title, fontname="hebo", fontsize=14, line_height=10 * _MM)
+            y += 3 * _MM
+
+        # Add text content
+        if content:
+            write(remove_non_ascii_bytes(content))
+            y += 5 * _MM
+
+        # Add figure as image (scaled to the FPDF layout width, aspect kept)
+        if fig is not None:
+            try:
+                image = futures[i].result()
+                pix = pymupdf.Pixmap(image)
+                height = _FIGURE_WIDTH * pix.height / pix.width
+                reserve(height)
+                page.insert_image(pymupdf.Rect(x0, y, x0 + _FIGURE_WIDTH, y + height), stream=image)
+                y += height + 10 * _MM
+            except Exception as e:
+                write(f"[Could not render figure: {e}]")
+                y += 5 * _MM